@@ -1,33 +1,82 @@
 import argparse
+import io
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import Future
 from PIL import Image
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import albumentations as A
 from albumentations.pytorch.transforms import ToTensorV2
 import numpy as np
 
 import torch
-from torchvision import transforms
-from torch.autograd import Variable
 
-
-from efficientnet_pytorch import EfficientNet
 from flask_cors import CORS
 
+from backends import BACKENDS, load_backend
+from batching import MicroBatcher
+from cache import PredictionCache, exact_key, perceptual_key
+from inference import Cascade, Classifier, configure_threads
+from metrics import CONTENT_TYPE, Registry
+from preprocess import Preprocessor
+from raw import is_raw
+from serve import serve_prefork
+
 app = Flask(__name__)
 CORS(app)
 app.app_context().push()
 
-def predict_image(image, model, device):
-    image_tensor = test_transforms(image).float().to(device)
-    image_tensor = image_tensor.unsqueeze_(0)
-    input_img = Variable(image_tensor)
-    input_img = input_img.to(device)
-    model.to(device)
-    output = model(input_img)
-    prob = torch.nn.functional.softmax(output, dim=1)
-    index = output.data.cpu().numpy().argmax()
-    confidence = prob[0][index].item()
-    return index, confidence
+logger = logging.getLogger('binsight.api')
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram(
+    'binsight_stage_seconds', 'Time spent in each stage of a prediction',
+    labels=('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'binsight_request_seconds', 'End-to-end request latency',
+    labels=('endpoint',))
+REQUESTS = registry.counter(
+    'binsight_requests_total', 'Requests received', labels=('endpoint',))
+ERRORS = registry.counter(
+    'binsight_errors_total', 'Requests or items that failed',
+    labels=('endpoint',))
+IN_FLIGHT = registry.gauge(
+    'binsight_requests_in_flight', 'Requests currently being handled')
+BATCH_SIZE = registry.histogram(
+    'binsight_batch_size', 'Images per forward pass',
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+MODEL_LOAD_SECONDS = registry.gauge(
+    'binsight_model_load_seconds', 'Time taken to load the model')
+CACHE_LOOKUPS = registry.counter(
+    'binsight_cache_lookups_total', 'Prediction cache lookups',
+    labels=('kind', 'outcome'))
+CACHE_ENTRIES = registry.gauge(
+    'binsight_cache_entries', 'Predictions currently cached')
+CASCADE_TIER = registry.counter(
+    'binsight_cascade_predictions_total',
+    'Images answered by each tier of the model cascade', labels=('tier',))
+IN_FLIGHT.set(0)
+
+def predict_batch(images, classifier, cascade=None):
+    # images are HxWx3 uint8 arrays from preprocessor.load; returns
+    # (index, confidence, tier) per image, tier is None without a cascade
+    BATCH_SIZE.observe(len(images))
+    with STAGE_SECONDS.time(stage='to_tensor'):
+        batch = classifier.prepare(images)
+    if cascade is not None:
+        with STAGE_SECONDS.time(stage='cascade'):
+            labels, scores, tiers = cascade.run(batch)
+        for tier in tiers:
+            CASCADE_TIER.inc(tier=tier)
+        return list(zip(labels, scores, tiers))
+    with STAGE_SECONDS.time(stage='forward'):
+        logits = classifier.logits(batch)
+    with STAGE_SECONDS.time(stage='softmax'):
+        labels, scores = classifier.top1(logits)
+    return [(label, score, None) for label, score in zip(labels, scores)]
 
 def get_args_parser():
     parser = argparse.ArgumentParser(
@@ -44,32 +93,255 @@ def get_args_parser():
         help='number of classes to classify (default: 7)')
     parser.add_argument(
         '--checkpoint',
-        help='path to directory to the saved checkpoint',
+        help='path to the saved Lightning checkpoint (.ckpt) or to weights '
+             'converted by convert_checkpoint.py',
         default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
     
     parser.add_argument('--device', help='specify device to use',
                         default="cpu", type=str)
-    
+    parser.add_argument('--backend', default='eager', choices=BACKENDS,
+                        help='inference runtime (default: eager)')
+    parser.add_argument('--exported', default=None, type=str,
+                        help='exported model file for the torchscript and '
+                             'onnx backends, see export.py')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='max number of requests coalesced into one '
+                             'forward pass (default: 8, 1 disables batching)')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='how long to wait for more requests before '
+                             'running a partial batch (default: 5)')
+    parser.add_argument('--no-jpeg-draft', action='store_true',
+                        help='decode JPEGs at full resolution before resizing')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='max cached predictions per worker, 0 disables '
+                             'the cache (default: 1024)')
+    parser.add_argument('--cache-ttl', type=float, default=300.0,
+                        help='seconds a cached prediction stays valid '
+                             '(default: 300)')
+    parser.add_argument('--perceptual-cache', action='store_true',
+                        help='also reuse predictions for images with the same '
+                             'perceptual hash, not just identical bytes')
+    parser.add_argument('--log-sample-rate', type=float, default=0.01,
+                        help='fraction of successful predictions logged '
+                             '(default: 0.01); errors are always logged')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of pre-forked server processes; 1 runs '
+                             'the Flask development server (default: 1)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='torch intra-op threads per worker '
+                             '(default: cpu count / workers)')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='run the eager/torchscript model in channels_last '
+                             'memory format (usually faster on CPU)')
+    parser.add_argument('--cascade-checkpoint', default=None, type=str,
+                        help='checkpoint of a smaller model that answers first; '
+                             'only images it is unsure about reach the main '
+                             'model (default: no cascade)')
+    parser.add_argument('--cascade-model-name', default='efficientnet-b0',
+                        type=str, help='architecture of the cascade model '
+                                       '(default: efficientnet-b0)')
+    parser.add_argument('--cascade-size', default=224, type=int,
+                        help='input size of the cascade model (default: 224)')
+    parser.add_argument('--cascade-threshold', default=0.9, type=float,
+                        help='softmax score at which the cascade model\'s '
+                             'answer is accepted, see calibrate_cascade.py '
+                             '(default: 0.9)')
     
     return parser
 
+def resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def lookup(data, raw=False):
+    # decodes encoded image bytes or a raw frame payload (see raw.py);
+    # returns (hit, image, keys) where hit is a cached prediction, if any
+    keys = []
+    if cache is not None:
+        keys.append(exact_key(data))
+        hit = cache.get(keys[0])
+        if hit is not None:
+            return hit, None, keys
+    with STAGE_SECONDS.time(stage='decode'):
+        image = preprocessor.load_raw(data) if raw \
+            else preprocessor.load(io.BytesIO(data))
+    if cache is not None and args.perceptual_cache:
+        keys.append(perceptual_key(image))
+        hit = cache.get(keys[1])
+        if hit is not None:
+            cache.put(keys[:1], hit)
+            return hit, image, keys
+    return None, image, keys
+
+def cached(future, keys):
+    if cache is not None:
+        def store(done):
+            if done.exception() is None:
+                cache.put(keys, done.result())
+        future.add_done_callback(store)
+    return future
+
+def classify(data, raw=False):
+    # returns a future resolving to (index, confidence, tier)
+    hit, image, keys = lookup(data, raw)
+    if hit is not None:
+        return resolved(hit)
+    return cached(batcher.submit(image), keys)
+
+def classify_many(uploads):
+    # decodes every upload first and then queues the misses as one group, so
+    # they share a forward pass however long decoding took; returns a future
+    # or the decode exception per upload, in order
+    outcomes = [None] * len(uploads)
+    misses = []
+    for i, data in enumerate(uploads):
+        try:
+            hit, image, keys = lookup(data)
+        except Exception as e:
+            outcomes[i] = e
+            continue
+        if hit is not None:
+            outcomes[i] = resolved(hit)
+        else:
+            misses.append((i, image, keys))
+    futures = batcher.submit_many([image for _, image, _ in misses])
+    for (i, _, keys), future in zip(misses, futures):
+        outcomes[i] = cached(future, keys)
+    return outcomes
+
+def log_event(event, **fields):
+    logger.info(json.dumps({'event': event, **fields}))
 
 @app.route('/predict', methods=['POST'])
 def predict():
+    start = time.perf_counter()
+    REQUESTS.inc(endpoint='predict')
+    IN_FLIGHT.inc()
     try:
-        file = request.files['file']
-        img = Image.open(file)
-        
-        index, confidence = predict_image(img, model, args.device)
+        with STAGE_SECONDS.time(stage='upload'):
+            raw = is_raw(request.content_type)
+            data = request.get_data() if raw else request.files['file'].read()
+        index, confidence, tier = classify(data, raw).result()
         class_name = args.classes[index]
 
         result = {'label': class_name, 'score': float(confidence)}
-        print(result)
+        if tier is not None:
+            result['tier'] = tier
+        if random.random() < args.log_sample_rate:
+            log_event('prediction', latency_ms=1000 * (time.perf_counter() - start),
+                      **result)
         return jsonify(result)
 
     except Exception as e:
+        ERRORS.inc(endpoint='predict')
+        log_event('error', endpoint='predict', error=str(e))
         return jsonify({'error': str(e)})
 
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='predict')
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch_stream():
+    # read the uploads now; the request's file streams are closed once the
+    # view returns, before the response body is generated
+    start = time.perf_counter()
+    REQUESTS.inc(endpoint='predict_batch')
+    IN_FLIGHT.inc()
+
+    def finish():
+        # the request lasts until its streamed body is done or abandoned
+        IN_FLIGHT.dec()
+        REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                endpoint='predict_batch')
+
+    try:
+        with STAGE_SECONDS.time(stage='upload'):
+            uploads = [(file.filename, file.read())
+                       for file in request.files.getlist('files')]
+    except Exception:
+        finish()
+        raise
+    if not uploads:
+        ERRORS.inc(endpoint='predict_batch')
+        finish()
+        return jsonify({'error': "no images in the 'files' field"}), 400
+
+    def generate():
+        # one JSON object per line, in upload order and tagged with the upload
+        # index, flushed as each chunk of --max-batch-size images finishes
+        for offset in range(0, len(uploads), args.max_batch_size):
+            chunk = uploads[offset:offset + args.max_batch_size]
+            outcomes = classify_many([data for _, data in chunk])
+            for i, ((filename, _), outcome) in enumerate(zip(chunk, outcomes),
+                                                         offset):
+                result = {'index': i, 'filename': filename}
+                try:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                    index, confidence, tier = outcome.result()
+                    result['label'] = args.classes[index]
+                    result['score'] = float(confidence)
+                    if tier is not None:
+                        result['tier'] = tier
+                except Exception as e:
+                    ERRORS.inc(endpoint='predict_batch')
+                    result['error'] = str(e)
+                yield json.dumps(result) + '\n'
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson')
+    response.call_on_close(finish)
+    return response
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(cache.stats() if cache is not None else {})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if cache is not None:
+        stats = cache.stats()
+        CACHE_ENTRIES.set(stats['size'])
+        for kind in ('exact', 'perceptual'):
+            for outcome in ('hits', 'misses'):
+                if kind in stats:
+                    CACHE_LOOKUPS.set_total(stats[kind][outcome], kind=kind,
+                                            outcome=outcome)
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+def init_worker(worker_id=0):
+    global model, batcher, cache
+    configure_threads(args.threads_per_worker)
+    if model is None:
+        model = load_model()
+    # the classifier's tensor buffers are only touched by the batcher thread
+    classifier = Classifier(model, args.device, channels_last=args.channels_last,
+                            preprocessor=preprocessor)
+    cascade = None
+    if small_model is not None:
+        size = (args.cascade_size, args.cascade_size)
+        cascade = Cascade(Classifier(small_model, args.device, size,
+                                     channels_last=args.channels_last),
+                          classifier, args.cascade_threshold)
+    batcher = MicroBatcher(
+        lambda images: predict_batch(images, classifier, cascade),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms)
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(args.cache_size, args.cache_ttl)
+
+def load_model():
+    start = time.perf_counter()
+    model = load_backend(args.backend, args.model_name, args.num_classes,
+                         args.checkpoint, args.exported, args.device)
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - start)
+    log_event('model_loaded', backend=args.backend,
+              seconds=time.perf_counter() - start)
+    return model
+
 def get_augmentation(transform):
     return lambda img: transform(image=np.array(img))
 
@@ -77,30 +349,43 @@ def get_augmentation(transform):
 if __name__ == '__main__':
     parser = get_args_parser()
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-    model = EfficientNet.from_pretrained(
-                args.model_name,
-                num_classes=args.num_classes)
-    checkpoint = torch.load(args.checkpoint, map_location=args.device)
-    new_checkpoint = {}
-    for k, v in checkpoint['state_dict'].items():
-        new_checkpoint[k.replace('efficient_net.', '')] = v
-
-    model.load_state_dict(new_checkpoint)
-    model.eval()
-    model.to(args.device)
-
-    test_transforms = transforms.Compose([transforms.Resize((260, 260)),
-                                            transforms.ToTensor(),
-                                            ])
-    
-    to_pil = transforms.ToPILImage()
-    
-    # file = 'test_recycle_1.jpg'
-    # file = 'test_paper_2.jpg'
-    # img = Image.open(file)  # PIL image
-    
-    # index, confidence = predict_image(img, model, args.device)
-    # print(args.classes[index], confidence)
+    small_model = None
+    if args.cascade_checkpoint:
+        small_model = load_backend('eager', args.cascade_model_name,
+                                   args.num_classes, args.cascade_checkpoint,
+                                   device=args.device)
+        if args.channels_last:
+            # as for the main model below: converted before forking so the
+            # workers share it
+            small_model.to(memory_format=torch.channels_last)
+        if args.cascade_checkpoint.endswith('.ckpt'):
+            small_model.share_memory()
+
+    model = None
+    # onnxruntime sessions do not survive a fork, so those are created per
+    # worker in init_worker
+    if args.backend != 'onnx':
+        model = load_model()
+        if args.channels_last and isinstance(model, torch.nn.Module):
+            # converted before forking so workers still share the weights
+            model.to(memory_format=torch.channels_last)
+        # workers forked below map the same weight pages instead of copying
+        # them; converted weights are already mapped from their file. Frozen
+        # TorchScript modules have no parameters (their weights are graph
+        # constants), so they are only shared through fork copy-on-write.
+        if args.backend == 'eager' and args.checkpoint.endswith('.ckpt'):
+            model.share_memory()
+
+    preprocessor = Preprocessor((260, 260), max_batch_size=args.max_batch_size,
+                                draft=not args.no_jpeg_draft)
 
-    app.run(debug=True, host='0.0.0.0', port=1117)
+    if args.workers > 1:
+        if args.threads_per_worker is None:
+            args.threads_per_worker = max(1, os.cpu_count() // args.workers)
+        serve_prefork(app, '0.0.0.0', 1117, args.workers,
+                      post_fork=init_worker)
+    else:
+        init_worker()
+        app.run(debug=True, host='0.0.0.0', port=1117)
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from backends import BACKENDS, load_backend
+from batching import MicroBatcher
+from inference import Classifier
+from preprocess import Preprocessor
+from raw import is_raw
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Serve the classifier with asyncio and bounded admission')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model to serve (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=4, metavar='NUM',
+        help='number of classes to classify (default: 4)')
+    parser.add_argument(
+        '--classes', type=list,
+        default = ['compost', 'paper', 'recycle', 'trash'],
+        help='class names in model output order')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to the saved Lightning checkpoint (.ckpt) or to weights '
+             'converted by convert_checkpoint.py',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--device', help='specify device to use',
+                        default="cpu", type=str)
+    parser.add_argument('--backend', default='eager', choices=BACKENDS,
+                        help='inference runtime (default: eager)')
+    parser.add_argument('--exported', default=None, type=str,
+                        help='exported model file for the torchscript and '
+                             'onnx backends, see export.py')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='max number of requests coalesced into one '
+                             'forward pass (default: 8)')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='how long to wait for more requests before '
+                             'running a partial batch (default: 5)')
+    parser.add_argument('--no-jpeg-draft', action='store_true',
+                        help='decode JPEGs at full resolution before resizing')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='run the eager/torchscript model in channels_last '
+                             'memory format (usually faster on CPU)')
+    parser.add_argument('--decode-workers', type=int, default=4,
+                        help='threads decoding and resizing uploads '
+                             '(default: 4)')
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='requests admitted at once; more are rejected '
+                             'with 503 (default: 64)')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Retry-After seconds sent with a 503 '
+                             '(default: 1)')
+    parser.add_argument('--max-upload-mb', type=float, default=20.0,
+                        help='largest accepted upload (default: 20)')
+    parser.add_argument('--host', default='0.0.0.0', type=str)
+    parser.add_argument('--port', default=1117, type=int)
+    return parser
+
+
+def create_app(args, model):
+    preprocessor = Preprocessor((260, 260), max_batch_size=args.max_batch_size,
+                                draft=not args.no_jpeg_draft)
+    classifier = Classifier(model, args.device, channels_last=args.channels_last,
+                            preprocessor=preprocessor)
+
+    def predict_batch(images):
+        return list(zip(*classifier.predict(images)))
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=args.max_batch_size,
+                           max_wait_ms=args.max_wait_ms)
+    executor = ThreadPoolExecutor(args.decode_workers)
+    max_upload = int(args.max_upload_mb * 2 ** 20)
+    pending = 0
+
+    async def read_upload(request):
+        if is_raw(request.content_type):
+            if (request.content_length or 0) > max_upload:
+                raise ValueError('upload too large')
+            return await request.read()
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name != 'file':
+                continue
+            data = bytearray()
+            while chunk := await part.read_chunk():
+                data += chunk
+                if len(data) > max_upload:
+                    raise ValueError('upload too large')
+            return bytes(data)
+        raise KeyError('file')
+
+    def load_encoded(data):
+        return preprocessor.load(io.BytesIO(data))
+
+    async def predict(request):
+        nonlocal pending
+        # shed load before reading the body, so a backlog cannot build up
+        if pending >= args.max_pending:
+            return web.json_response(
+                {'error': 'server busy'}, status=503,
+                headers={'Retry-After': str(args.retry_after)})
+        pending += 1
+        try:
+            data = await read_upload(request)
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(
+                executor, preprocessor.load_raw if is_raw(request.content_type)
+                else load_encoded, data)
+            index, confidence = await asyncio.wrap_future(
+                batcher.submit(image))
+            result = {'label': args.classes[index], 'score': float(confidence)}
+            return web.json_response(result)
+        except Exception as e:
+            return web.json_response({'error': str(e)})
+        finally:
+            pending -= 1
+
+    @web.middleware
+    async def cors(request, handler):
+        response = await handler(request)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    app = web.Application(middlewares=[cors], client_max_size=max_upload)
+    app.router.add_post('/predict', predict)
+
+    async def shutdown(app):
+        executor.shutdown(wait=False)
+
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    start = time.perf_counter()
+    model = load_backend(args.backend, args.model_name, args.num_classes,
+                         args.checkpoint, args.exported, args.device)
+    print(f'model loaded in {time.perf_counter() - start:.2f}s')
+
+    web.run_app(create_app(args, model), host=args.host, port=args.port)
@@ -0,0 +1,72 @@
+import torch
+from efficientnet_pytorch import EfficientNet
+
+BACKENDS = ('eager', 'torchscript', 'onnx')
+
+
+def load_state_dict(checkpoint_path, device='cpu'):
+    if checkpoint_path.endswith('.ckpt'):
+        # Lightning checkpoints prefix every key with the wrapped module's name
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        return {k.replace('efficient_net.', ''): v
+                for k, v in checkpoint['state_dict'].items()}
+    # weights from convert_checkpoint.py: keys are already stripped and the
+    # tensors are paged in from the file on first use instead of copied
+    return torch.load(checkpoint_path, map_location=device, mmap=True,
+                      weights_only=True)
+
+
+def load_eager(model_name, num_classes, checkpoint_path, device='cpu'):
+    state_dict = load_state_dict(checkpoint_path, device)
+    # build the architecture without allocating or initialising weights (and
+    # without downloading ImageNet ones), then adopt the loaded tensors as-is
+    with torch.device('meta'):
+        model = EfficientNet.from_name(model_name, num_classes=num_classes)
+    model.load_state_dict(state_dict, assign=True)
+    # the memory-efficient swish only saves memory in backward; the plain one
+    # is faster for inference and is required for tracing/export
+    model.set_swish(memory_efficient=False)
+    model.eval()
+    model.to(device)
+    return model
+
+
+def load_torchscript(path, device='cpu'):
+    model = torch.jit.load(path, map_location=device)
+    model.eval()
+    return model
+
+
+class OnnxModel:
+    """Runs an exported ONNX graph with ONNX Runtime, tensors in and out."""
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = {self.input_name: batch.detach().cpu().numpy()}
+        return torch.from_numpy(self.session.run(None, inputs)[0])
+
+
+def load_backend(backend, model_name, num_classes, checkpoint_path,
+                 exported_path=None, device='cpu'):
+    """Return a callable mapping an (N, 3, H, W) batch to (N, classes) logits."""
+    if backend == 'eager':
+        return load_eager(model_name, num_classes, checkpoint_path, device)
+    if exported_path is None:
+        raise ValueError(f'the {backend} backend needs an exported model file, '
+                         'see export.py')
+    if backend == 'torchscript':
+        return load_torchscript(exported_path, device)
+    if backend == 'onnx':
+        if device != 'cpu':
+            raise ValueError('the onnx backend only runs on cpu')
+        return OnnxModel(exported_path, torch.get_num_threads())
+    raise ValueError(f'unknown backend {backend!r}, expected one of {BACKENDS}')
@@ -0,0 +1,76 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-item calls into one batched call.
+
+    Items submitted within `max_wait_ms` of the first item of a batch are
+    grouped (up to `max_batch_size`) and passed to `batch_fn` as a list.
+    `batch_fn` must return one result per item, in order. `submit_many`
+    queues several items as one group that is never split across batches.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5.0):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be >= 1')
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items):
+        futures = [Future() for _ in items]
+        if futures:
+            self._queue.put(list(zip(items, futures)))
+        return futures
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        # the queue holds groups; a group that does not fit in this batch is
+        # carried over to start the next one
+        batch = list(self._carry or self._queue.get())
+        self._carry = None
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    group = self._queue.get(timeout=remaining)
+                else:
+                    # window closed, but take whatever is already waiting
+                    group = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if len(batch) + len(group) > self.max_batch_size:
+                self._carry = group
+                break
+            batch.extend(group)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(futures):
+                    raise RuntimeError(f'batch_fn returned {len(results)} '
+                                       f'results for {len(futures)} items')
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
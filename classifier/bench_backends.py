@@ -0,0 +1,67 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from backends import load_backend
+
+
+def benchmark(model, batch_size, image_size, iters, warmup):
+    batch = torch.rand(batch_size, 3, image_size, image_size)
+    latencies = []
+    with torch.no_grad():
+        for i in range(warmup + iters):
+            start = time.perf_counter()
+            model(batch)
+            if i >= warmup:
+                latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'images_per_s': float(batch_size * 1000 / latencies.mean())}
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Compare eager, TorchScript and ONNX Runtime inference on CPU')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=4, metavar='NUM',
+        help='number of classes to classify (default: 4)')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--exported', default='./exported/effnet', type=str,
+                        help='export.py output path without extension')
+    parser.add_argument('--backends', nargs='+',
+                        default=['eager', 'torchscript', 'onnx'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--image-size', default=260, type=int)
+    parser.add_argument('--threads', default=None, type=int,
+                        help='torch / onnxruntime threads (default: all)')
+    parser.add_argument('--iters', default=20, type=int)
+    parser.add_argument('--warmup', default=3, type=int)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    extensions = {'torchscript': '.ts', 'onnx': '.onnx'}
+    for backend in args.backends:
+        exported = args.exported + extensions.get(backend, '')
+        model = load_backend(backend, args.model_name, args.num_classes,
+                             args.checkpoint, exported)
+        for batch_size in args.batch_sizes:
+            result = benchmark(model, batch_size, args.image_size,
+                               args.iters, args.warmup)
+            print(f'{backend:>11} batch {batch_size:>3}: '
+                  f'p50 {result["p50_ms"]:8.2f} ms, '
+                  f'p95 {result["p95_ms"]:8.2f} ms, '
+                  f'{result["images_per_s"]:7.1f} images/s')
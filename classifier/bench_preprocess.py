@@ -0,0 +1,94 @@
+import argparse
+import glob
+import io
+import os
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from preprocess import Preprocessor
+
+
+def synthetic_jpeg(width, height, seed=0):
+    # smooth gradients plus noise compress roughly like a camera frame
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 12, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def load_inputs(args):
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, '**', '*.jpg'),
+                                 recursive=True))[:args.num]
+        return [open(path, 'rb').read() for path in paths]
+    return [synthetic_jpeg(args.width, args.height, seed)
+            for seed in range(args.num)]
+
+
+def time_batches(fn, inputs, batch_size, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(inputs), batch_size):
+            fn(inputs[i:i + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Compare torchvision and fast preprocessing')
+    parser.add_argument('--images', default=None, type=str,
+                        help='directory of JPEGs (default: synthetic images)')
+    parser.add_argument('--num', default=32, type=int,
+                        help='number of images (default: 32)')
+    parser.add_argument('--width', default=4032, type=int,
+                        help='synthetic image width (default: 4032)')
+    parser.add_argument('--height', default=3024, type=int,
+                        help='synthetic image height (default: 3024)')
+    parser.add_argument('--batch-size', default=8, type=int)
+    parser.add_argument('--repeats', default=3, type=int)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    inputs = load_inputs(args)
+
+    test_transforms = transforms.Compose([transforms.Resize((260, 260)),
+                                          transforms.ToTensor(),
+                                          ])
+    fast = Preprocessor((260, 260), max_batch_size=args.batch_size)
+    exact = Preprocessor((260, 260), max_batch_size=args.batch_size,
+                         draft=False)
+
+    def reference(batch):
+        return torch.stack([
+            test_transforms(Image.open(io.BytesIO(data)).convert('RGB')).float()
+            for data in batch])
+
+    def preprocessor(engine):
+        return lambda batch: engine([io.BytesIO(data) for data in batch])
+
+    ref = reference(inputs[:args.batch_size])
+    for name, engine in [('exact', exact), ('draft', fast)]:
+        diff = (preprocessor(engine)(inputs[:args.batch_size]) - ref).abs()
+        print(f'{name:>9} vs torchvision: max abs diff {diff.max():.4f}, '
+              f'mean abs diff {diff.mean():.5f}')
+
+    n = len(inputs)
+    for name, fn in [('torchvision', reference),
+                     ('exact', preprocessor(exact)),
+                     ('draft', preprocessor(fast))]:
+        seconds = time_batches(fn, inputs, args.batch_size, args.repeats)
+        print(f'{name:>11}: {1000 * seconds / n:7.2f} ms/image '
+              f'({n / seconds:7.1f} images/s)')
@@ -0,0 +1,68 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+START = time.perf_counter()
+
+
+def cold_start(args):
+    # runs in a fresh interpreter so imports and page cache state are real
+    import torch
+    from backends import load_eager
+    imported = time.perf_counter()
+
+    model = load_eager(args.model_name, args.num_classes, args.checkpoint)
+    loaded = time.perf_counter()
+
+    with torch.no_grad():
+        model(torch.rand(1, 3, args.image_size, args.image_size))
+    predicted = time.perf_counter()
+
+    return {'checkpoint': args.checkpoint,
+            'import_s': imported - START,
+            'load_s': loaded - imported,
+            'first_predict_s': predicted - loaded,
+            'total_s': predicted - START}
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Measure cold start to first prediction')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=4, metavar='NUM',
+        help='number of classes to classify (default: 4)')
+    parser.add_argument('--checkpoints', nargs='+', required=True,
+                        help='.ckpt and/or converted weights files to compare')
+    parser.add_argument('--image-size', default=260, type=int)
+    parser.add_argument('--repeats', default=3, type=int)
+    parser.add_argument('--checkpoint', help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    if args.checkpoint:
+        print(json.dumps(cold_start(args)))
+        sys.exit()
+
+    for checkpoint in args.checkpoints:
+        runs = []
+        for _ in range(args.repeats):
+            output = subprocess.run(
+                [sys.executable, __file__, '--checkpoints', checkpoint,
+                 '--checkpoint', checkpoint,
+                 '--model_name', args.model_name,
+                 '--num-classes', str(args.num_classes),
+                 '--image-size', str(args.image_size)],
+                check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run['total_s'])
+        print(f'{checkpoint}: import {best["import_s"]:.2f}s, '
+              f'load {best["load_s"]:.3f}s, '
+              f'first predict {best["first_predict_s"]:.3f}s, '
+              f'total {best["total_s"]:.2f}s')
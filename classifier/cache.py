@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def exact_key(data):
+    return ('exact', hashlib.blake2b(data, digest_size=16).digest())
+
+
+def perceptual_key(image, hash_size=8):
+    """64-bit difference hash of an HxWx3 uint8 array.
+
+    Re-encoded or slightly noisy captures of the same scene hash to the same
+    value, so they can share a cached prediction.
+    """
+    small = Image.fromarray(image).convert('L').resize(
+        (hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return ('perceptual', int.from_bytes(np.packbits(bits).tobytes(), 'big'))
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of predictions with a per-entry TTL.
+
+    Keys come from `exact_key` / `perceptual_key`; hits and misses are
+    counted separately for each kind of key. The cache lives in process
+    memory, so with pre-forked workers each worker keeps its own.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {}
+        self.evictions = 0
+
+    def _count(self, kind, outcome):
+        counts = self._counts.setdefault(kind, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._count(key[0], 'misses')
+                return None
+            self._entries.move_to_end(key)
+            self._count(key[0], 'hits')
+            return entry[0]
+
+    def put(self, keys, value):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key in keys:
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries),
+                    'max_entries': self.max_entries,
+                    'evictions': self.evictions,
+                    **{kind: dict(counts)
+                       for kind, counts in self._counts.items()}}
@@ -0,0 +1,120 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+import torchvision
+import torchvision.transforms as transforms
+
+from inference import Cascade, load_classifier
+from packed_dataset import PackedDataset
+
+
+def collect(cascade, data, args):
+    """Small-model answers and large-model labels for the whole split."""
+    loader = torch.utils.data.DataLoader(data, batch_size=args.batch_size,
+                                         num_workers=args.workers)
+    small_labels, small_scores, large_labels, targets = [], [], [], []
+    small_time = large_time = 0.0
+    for images, labels in loader:
+        batch = cascade.large.to_device(images)
+        start = time.perf_counter()
+        l, s = cascade.small.predict_tensor(cascade.downscale(batch))
+        small_time += time.perf_counter() - start
+        start = time.perf_counter()
+        l2, _ = cascade.large.top1(cascade.large.logits(batch))
+        large_time += time.perf_counter() - start
+        small_labels += l
+        small_scores += s
+        large_labels += l2
+        targets += labels.tolist()
+    n = len(targets)
+    return (np.array(small_labels), np.array(small_scores),
+            np.array(large_labels), np.array(targets),
+            small_time / n, large_time / n)
+
+
+def choose_threshold(small_labels, small_scores, large_labels, targets,
+                     max_accuracy_loss):
+    """Lowest threshold whose cascade accuracy stays within the budget of
+    the large model alone (the lowest sends the fewest images onward)."""
+    large_accuracy = float((large_labels == targets).mean())
+    candidates = np.unique(np.concatenate([small_scores, [np.inf]]))
+    for threshold in candidates:
+        accepted = small_scores >= threshold
+        labels = np.where(accepted, small_labels, large_labels)
+        accuracy = float((labels == targets).mean())
+        if large_accuracy - accuracy <= max_accuracy_loss:
+            return float(threshold), accuracy, float(1 - accepted.mean())
+    return float('inf'), large_accuracy, 1.0
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Pick the cascade threshold on a validation split')
+    parser.add_argument('--data_img', default=None, type=str,
+                        help='ImageFolder validation split')
+    parser.add_argument('--packed', default=None, type=str,
+                        help='validation split packed by packed_dataset.py')
+    parser.add_argument('--max-accuracy-loss', default=0.005, type=float,
+                        help='accuracy the cascade may lose against the large '
+                             'model alone (default: 0.005)')
+    parser.add_argument('--model_name', default='efficientnet-b2', type=str)
+    parser.add_argument(
+        '--checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--cascade-model-name', default='efficientnet-b0',
+                        type=str)
+    parser.add_argument('--cascade-checkpoint', required=True, type=str)
+    parser.add_argument('--cascade-size', default=224, type=int)
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument('--device', default='cpu', type=str)
+    parser.add_argument('--batch-size', default=32, type=int)
+    parser.add_argument('--workers', default=4, type=int)
+    parser.add_argument('--json', default=None, type=str,
+                        help='also write the results here')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    if args.packed:
+        data = PackedDataset(args.packed)
+    elif args.data_img:
+        data = torchvision.datasets.ImageFolder(
+            args.data_img, transform=transforms.Compose([
+                transforms.Resize((260, 260)), transforms.ToTensor()]))
+    else:
+        raise SystemExit('give --data_img or --packed')
+
+    large = load_classifier(args.model_name, args.num_classes,
+                            args.checkpoint, args.device)
+    small = load_classifier(args.cascade_model_name, args.num_classes,
+                            args.cascade_checkpoint, args.device,
+                            size=(args.cascade_size, args.cascade_size))
+    cascade = Cascade(small, large, threshold=None)
+
+    small_labels, small_scores, large_labels, targets, small_s, large_s = \
+        collect(cascade, data, args)
+    threshold, accuracy, escalated = choose_threshold(
+        small_labels, small_scores, large_labels, targets,
+        args.max_accuracy_loss)
+    results = {
+        'images': len(targets),
+        'threshold': threshold,
+        'max_accuracy_loss': args.max_accuracy_loss,
+        'large_accuracy': round(float((large_labels == targets).mean()), 4),
+        'small_accuracy': round(float((small_labels == targets).mean()), 4),
+        'cascade_accuracy': round(accuracy, 4),
+        'escalated_fraction': round(escalated, 4),
+        'large_ms_per_image': round(1000 * large_s, 3),
+        'cascade_ms_per_image': round(1000 * (small_s + escalated * large_s), 3),
+    }
+    print(json.dumps(results, indent=2))
+    print(f'serve with: --cascade-checkpoint {args.cascade_checkpoint} '
+          f'--cascade-model-name {args.cascade_model_name} '
+          f'--cascade-size {args.cascade_size} --cascade-threshold {threshold}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,28 @@
+import argparse
+import os
+
+import torch
+
+from backends import load_state_dict
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Convert a Lightning checkpoint into a memory-mappable weights file')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--out', default='./weights/effnet-b2.pt', type=str,
+                        help='where to write the converted weights')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    state_dict = {k: v.contiguous()
+                  for k, v in load_state_dict(args.checkpoint).items()}
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    torch.save(state_dict, args.out)
+    size = os.path.getsize(args.out) / 2 ** 20
+    print(f'saved {len(state_dict)} tensors ({size:.1f} MiB) to {args.out}')
@@ -0,0 +1,92 @@
+import argparse
+import glob
+import os
+import sys
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from backends import OnnxModel, load_eager, load_torchscript
+
+
+def export_torchscript(model, example, path):
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    torch.jit.save(torch.jit.freeze(traced), path)
+
+
+def export_onnx(model, example, path, opset=13):
+    with torch.no_grad():
+        torch.onnx.export(
+            model, example, path,
+            input_names=['input'], output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset)
+
+
+def check_parity(models, images, atol):
+    test_transforms = transforms.Compose([transforms.Resize((260, 260)),
+                                          transforms.ToTensor(),
+                                          ])
+    batch = torch.stack([test_transforms(Image.open(path).convert('RGB'))
+                         for path in images])
+    with torch.no_grad():
+        outputs = {name: model(batch) for name, model in models.items()}
+    reference = outputs.pop('eager')
+    ok = True
+    for name, logits in outputs.items():
+        diff = (logits - reference).abs().max().item()
+        same_labels = bool((logits.argmax(1) == reference.argmax(1)).all())
+        ok = ok and diff <= atol and same_labels
+        print(f'{name:>11} vs eager on {len(images)} images: '
+              f'max abs logit diff {diff:.2e}, same labels: {same_labels}')
+    return ok
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Export a trained classifier to TorchScript and ONNX')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model to export (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=4, metavar='NUM',
+        help='number of classes to classify (default: 4)')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--out', default='./exported/effnet', type=str,
+                        help='output path without extension; writes '
+                             '<out>.ts and <out>.onnx')
+    parser.add_argument('--image-size', default=260, type=int)
+    parser.add_argument('--opset', default=13, type=int)
+    parser.add_argument('--check-images', nargs='*',
+                        default=sorted(glob.glob('./test_*.jpg')),
+                        help='images for the parity check '
+                             '(default: ./test_*.jpg)')
+    parser.add_argument('--atol', default=1e-3, type=float,
+                        help='max allowed logit difference vs eager')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    model = load_eager(args.model_name, args.num_classes, args.checkpoint)
+    example = torch.rand(1, 3, args.image_size, args.image_size)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+
+    ts_path, onnx_path = args.out + '.ts', args.out + '.onnx'
+    export_torchscript(model, example, ts_path)
+    print('saved', ts_path)
+    export_onnx(model, example, onnx_path, args.opset)
+    print('saved', onnx_path)
+
+    if args.check_images:
+        models = {'eager': model,
+                  'torchscript': load_torchscript(ts_path),
+                  'onnx': OnnxModel(onnx_path)}
+        if not check_parity(models, args.check_images, args.atol):
+            sys.exit('parity check failed')
@@ -0,0 +1,192 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from backends import BACKENDS, load_backend
+from preprocess import Preprocessor
+
+
+def configure_threads(num_threads=None, interop_threads=None):
+    """Set torch's intra-op (and, once per process, inter-op) threads."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # only allowed before the first parallel op of the process
+            pass
+
+
+class Classifier:
+    """Batch-first inference around any model from `load_backend`.
+
+    `predict(images)` takes a list of PIL images, paths, file objects or
+    RGB uint8 arrays and returns `(labels, scores)`: the top-1 class index
+    and its softmax probability for each image. The model is moved to the
+    device once and forward passes run under `inference_mode`.
+
+    The preprocessor reuses its buffers, so call `prepare`/`predict` from one
+    thread at a time (the micro-batcher in api.py does).
+    """
+
+    def __init__(self, model, device='cpu', size=(260, 260), max_batch_size=8,
+                 channels_last=False, preprocessor=None):
+        self.device = device
+        self.size = size
+        self.channels_last = channels_last
+        self.preprocessor = preprocessor or Preprocessor(
+            size, max_batch_size, draft=False)
+        if isinstance(model, torch.nn.Module):
+            model = model.to(device)
+            if channels_last:
+                model = model.to(memory_format=torch.channels_last)
+        self.model = model
+
+    def load(self, image):
+        """One image -> HxWx3 uint8 array at the model's input size."""
+        if isinstance(image, np.ndarray):
+            if image.shape[:2] == self.size:
+                return image
+            image = Image.fromarray(image)
+        return self.preprocessor.load(image)
+
+    def prepare(self, images):
+        batch = self.preprocessor.to_tensor([self.load(image) for image in images])
+        return self.to_device(batch)
+
+    def to_device(self, batch):
+        if batch.dtype == torch.uint8:
+            batch = batch.float().div_(255)
+        batch = batch.to(self.device, non_blocking=True)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def logits(self, batch):
+        with torch.inference_mode():
+            return self.model(batch)
+
+    def top1(self, logits):
+        with torch.inference_mode():
+            scores, labels = torch.nn.functional.softmax(logits, dim=1).max(dim=1)
+        return labels.cpu().tolist(), scores.cpu().tolist()
+
+    def predict_tensor(self, batch):
+        """(N, 3, H, W) float in [0, 1] or uint8 -> (labels, scores)."""
+        return self.top1(self.logits(self.to_device(batch)))
+
+    def predict(self, images):
+        return self.top1(self.logits(self.prepare(images)))
+
+
+class Cascade:
+    """Confidence-gated cascade of a small and a large `Classifier`.
+
+    Every image is first scored by the small model on a downscaled copy of
+    the large model's input. Answers whose softmax score reaches `threshold`
+    are kept; only the rest go through the large model. `predict` returns
+    `(labels, scores, tiers)` where each tier is 'small' or 'large'. Pick the
+    threshold with calibrate_cascade.py.
+    """
+
+    def __init__(self, small, large, threshold):
+        self.small = small
+        self.large = large
+        self.threshold = threshold
+        self.size = large.size
+        self.preprocessor = large.preprocessor
+
+    def prepare(self, images):
+        return self.large.prepare(images)
+
+    def downscale(self, batch):
+        if tuple(batch.shape[-2:]) == self.small.size:
+            return batch
+        with torch.inference_mode():
+            return torch.nn.functional.interpolate(
+                batch, size=self.small.size, mode='bilinear',
+                align_corners=False, antialias=True)
+
+    def run(self, batch):
+        """Large-model input batch -> (labels, scores, tiers)."""
+        labels, scores = self.small.predict_tensor(self.downscale(batch))
+        tiers = ['small'] * len(labels)
+        uncertain = [i for i, score in enumerate(scores) if score < self.threshold]
+        if uncertain:
+            large_labels, large_scores = self.large.top1(
+                self.large.logits(batch[uncertain]))
+            for i, label, score in zip(uncertain, large_labels, large_scores):
+                labels[i], scores[i], tiers[i] = label, score, 'large'
+        return labels, scores, tiers
+
+    def predict_tensor(self, batch):
+        return self.run(self.large.to_device(batch))
+
+    def predict(self, images):
+        return self.run(self.prepare(images))
+
+
+def load_classifier(model_name, num_classes, checkpoint_path, device='cpu',
+                    backend='eager', exported_path=None, channels_last=False,
+                    num_threads=None, **kwargs):
+    configure_threads(num_threads)
+    model = load_backend(backend, model_name, num_classes, checkpoint_path,
+                         exported_path, device)
+    return Classifier(model, device, channels_last=channels_last, **kwargs)
+
+
+def benchmark(classifier, batch_size, iterations, warmup=3):
+    rng = np.random.default_rng(0)
+    height, width = classifier.size
+    images = list(rng.integers(0, 256, (batch_size, height, width, 3),
+                               dtype=np.uint8))
+    for _ in range(warmup):
+        classifier.predict(images)
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        classifier.predict(images)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('Benchmark Classifier.predict')
+    parser.add_argument('--model_name', default='efficientnet-b2', type=str)
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument(
+        '--checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--backend', default='eager', choices=BACKENDS)
+    parser.add_argument('--exported', default=None, type=str)
+    parser.add_argument('--device', default='cpu', type=str)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--threads', nargs='+', type=int, default=[None],
+                        help='intra-op thread counts to try '
+                             '(default: torch default)')
+    parser.add_argument('--iterations', default=20, type=int)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    model = load_backend(args.backend, args.model_name, args.num_classes,
+                         args.checkpoint, args.exported, args.device)
+    layouts = [False, True] if isinstance(model, torch.nn.Module) else [False]
+    for channels_last in layouts:
+        classifier = Classifier(model, args.device, channels_last=channels_last,
+                                max_batch_size=max(args.batch_sizes))
+        for threads in args.threads:
+            configure_threads(threads)
+            for batch_size in args.batch_sizes:
+                times = benchmark(classifier, batch_size, args.iterations)
+                print(f'{"channels_last" if channels_last else "contiguous":>13} '
+                      f'threads={torch.get_num_threads():<3} '
+                      f'batch={batch_size:<3} '
+                      f'p50 {np.percentile(times, 50):7.2f} ms  '
+                      f'p95 {np.percentile(times, 95):7.2f} ms  '
+                      f'{batch_size * 1000 / np.median(times):7.1f} images/s')
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torchvision
+
+from preprocess import Preprocessor
+
+
+def pack(data_dir, out_dir, size=(260, 260), workers=8):
+    """Decodes an ImageFolder split once into `out_dir`.
+
+    Writes `images.npy` (N x 3 x H x W uint8), `labels.npy` (N int64) and
+    `index.json` (classes, image size and the source path of every row).
+    Images are resized exactly like `Resize(size)` on the PIL image.
+    """
+    folder = torchvision.datasets.ImageFolder(data_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    height, width = size
+    images = np.lib.format.open_memmap(
+        os.path.join(out_dir, 'images.npy'), mode='w+', dtype=np.uint8,
+        shape=(len(folder.samples), 3, height, width))
+    labels = np.array([label for _, label in folder.samples], np.int64)
+    preprocessor = Preprocessor(size, draft=False)
+
+    def load(i):
+        images[i] = preprocessor.load(folder.samples[i][0]).transpose(2, 0, 1)
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(load, range(len(folder.samples))))
+    images.flush()
+    np.save(os.path.join(out_dir, 'labels.npy'), labels)
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump({'root': os.path.abspath(data_dir),
+                   'classes': folder.classes,
+                   'size': [height, width],
+                   'paths': [path for path, _ in folder.samples]}, f)
+    return len(labels)
+
+
+class PackedDataset(torch.utils.data.Dataset):
+    """Serves a split written by `pack` straight from the memory map.
+
+    Items are (3 x H x W uint8 tensor, label) views of the mapped file, so
+    nothing is decoded or copied until the batch is collated; scale batches
+    with `to_float` on the consumer side. The map is opened lazily so each
+    DataLoader worker gets its own.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        self.classes = index['classes']
+        self.size = tuple(index['size'])
+        self.paths = index['paths']
+        self.targets = np.load(os.path.join(path, 'labels.npy'))
+        self._images = None
+
+    @property
+    def images(self):
+        if self._images is None:
+            # copy-on-write, so the pages are shared but torch gets a
+            # writable array and does not warn
+            self._images = np.load(os.path.join(self.path, 'images.npy'),
+                                   mmap_mode='c')
+        return self._images
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, i):
+        return torch.from_numpy(self.images[i]), int(self.targets[i])
+
+
+def to_float(images):
+    """uint8 batch -> float in [0, 1], the same values `ToTensor` gives."""
+    if images.dtype == torch.uint8:
+        return images.float().div_(255)
+    return images
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Pack an ImageFolder split into a memory-mapped uint8 array')
+    parser.add_argument('data', help='ImageFolder split, e.g. .../test')
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('--size', default=260, type=int,
+                        help='square image size (default: 260)')
+    parser.add_argument('--workers', default=8, type=int,
+                        help='decode threads (default: 8)')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    start = time.perf_counter()
+    n = pack(args.data, args.out, (args.size, args.size), args.workers)
+    elapsed = time.perf_counter() - start
+    print(f'packed {n} images into {args.out} in {elapsed:.1f}s '
+          f'({n / elapsed:.1f} images/s)')
@@ -0,0 +1,63 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from raw import decode_frame
+
+
+class Preprocessor:
+    """Fast replacement for `Resize(size)` + `ToTensor()`.
+
+    `load` decodes and resizes one image to an HxWx3 uint8 array. Large JPEGs
+    are decoded at 1/2, 1/4 or 1/8 scale in the DCT domain first (`draft`),
+    which skips most of the decode work. `to_tensor` packs a batch of those
+    arrays into a preallocated buffer and scales it to float in one pass.
+
+    `load` is thread-safe; `to_tensor` reuses its buffers, so call it from a
+    single thread and consume the returned tensor before the next call.
+    """
+
+    def __init__(self, size=(260, 260), max_batch_size=8, draft=True):
+        self.size = size
+        self.draft = draft
+        self._allocate(max_batch_size)
+
+    def _allocate(self, batch_size):
+        height, width = self.size
+        self._uint8 = np.empty((batch_size, height, width, 3), np.uint8)
+        self._float = np.empty((batch_size, 3, height, width), np.float32)
+
+    def load(self, image):
+        if not isinstance(image, Image.Image):
+            image = Image.open(image)
+        height, width = self.size
+        if self.draft and image.format == 'JPEG':
+            # picks the largest DCT scale that still covers the target size
+            image.draft('RGB', (width, height))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.BILINEAR)
+        return np.asarray(image)
+
+    def load_raw(self, data):
+        """Raw frame payload (see raw.py) -> HxWx3 uint8 RGB array; frames
+        already at the model's input size are used as-is, without a copy."""
+        frame = decode_frame(data)
+        if frame.shape[:2] != self.size:
+            frame = self.load(Image.fromarray(frame))
+        return frame
+
+    def to_tensor(self, arrays):
+        n = len(arrays)
+        if n > len(self._uint8):
+            self._allocate(n)
+        for i, array in enumerate(arrays):
+            self._uint8[i] = array
+        out = self._float[:n]
+        np.divide(self._uint8[:n].transpose(0, 3, 1, 2), np.float32(255),
+                  out=out, dtype=np.float32)
+        return torch.from_numpy(out)
+
+    def __call__(self, images):
+        return self.to_tensor([self.load(image) for image in images])
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import torch
+import torchvision
+import torchvision.transforms as transforms
+
+from backends import OnnxModel, load_eager
+from export import export_onnx
+from inference import Classifier, benchmark
+from packed_dataset import PackedDataset
+
+
+def load_split(path):
+    if os.path.exists(os.path.join(path, 'index.json')):
+        return PackedDataset(path)
+    return torchvision.datasets.ImageFolder(
+        path, transform=transforms.Compose([transforms.Resize((260, 260)),
+                                            transforms.ToTensor()]))
+
+
+def calibration_reader(data, input_name, num_images, batch_size, seed=0):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    indices = np.random.default_rng(seed).permutation(len(data))[:num_images]
+    loader = torch.utils.data.DataLoader(
+        torch.utils.data.Subset(data, indices.tolist()), batch_size=batch_size)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(loader)
+
+        def get_next(self):
+            images, _ = next(self.batches, (None, None))
+            if images is None:
+                return None
+            if images.dtype == torch.uint8:
+                images = images.float().div_(255)
+            return {input_name: images.numpy()}
+
+    return Reader()
+
+
+def quantize(fp32_path, out_path, reader, per_channel=True):
+    from onnxruntime.quantization import (QuantFormat, QuantType,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, 'prepared.onnx')
+        try:
+            # folds constants and fuses BN into convs so they quantize well
+            quant_pre_process(fp32_path, prepared)
+        except Exception as e:
+            print(f'pre-processing skipped: {e}', file=sys.stderr)
+            prepared = fp32_path
+        quantize_static(prepared, out_path, reader,
+                        quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8)
+
+
+def accuracy(classifier, data, batch_size):
+    loader = torch.utils.data.DataLoader(data, batch_size=batch_size)
+    correct = total = 0
+    for images, labels in loader:
+        preds, _ = classifier.predict_tensor(images)
+        correct += int((np.array(preds) == labels.numpy()).sum())
+        total += len(labels)
+    return correct / total
+
+
+def latency(classifier, batch_sizes, iterations):
+    return {str(n): round(float(np.median(benchmark(classifier, n, iterations))), 2)
+            for n in batch_sizes}
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Quantize the classifier to INT8 (ONNX Runtime, static) and check '
+        'it against fp32')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model to quantize (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=4, metavar='NUM',
+        help='number of classes to classify (default: 4)')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--calibration-data', required=True, type=str,
+                        help='ImageFolder (or packed) split to calibrate '
+                             'activation ranges on, e.g. the train split')
+    parser.add_argument('--calibration-images', default=256, type=int,
+                        help='images used for calibration (default: 256)')
+    parser.add_argument('--eval-data', required=True, type=str,
+                        help='ImageFolder (or packed) split for the accuracy '
+                             'check')
+    parser.add_argument('--max-accuracy-drop', default=0.01, type=float,
+                        help='refuse to write the model if it loses more '
+                             'accuracy than this vs fp32 (default: 0.01)')
+    parser.add_argument('--out', default='./exported/effnet.int8.onnx',
+                        type=str)
+    parser.add_argument('--image-size', default=260, type=int)
+    parser.add_argument('--opset', default=13, type=int)
+    parser.add_argument('--no-per-channel', action='store_true',
+                        help='one scale per weight tensor instead of per '
+                             'output channel')
+    parser.add_argument('--batch-size', default=16, type=int)
+    parser.add_argument('--bench-iterations', default=10, type=int)
+    parser.add_argument('--json', default=None, type=str,
+                        help='also write the report here')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+
+    model = load_eager(args.model_name, args.num_classes, args.checkpoint)
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = os.path.join(tmp, 'fp32.onnx')
+        example = torch.rand(1, 3, args.image_size, args.image_size)
+        export_onnx(model, example, fp32_path, args.opset)
+        # newer exporters keep the weights in a side file next to the graph
+        fp32_bytes = sum(os.path.getsize(os.path.join(tmp, name))
+                         for name in os.listdir(tmp) if name.startswith('fp32'))
+        reader = calibration_reader(load_split(args.calibration_data), 'input',
+                                    args.calibration_images, args.batch_size)
+        tmp_out = os.path.join(tmp, 'int8.onnx')
+        quantize(fp32_path, tmp_out, reader, not args.no_per_channel)
+        int8_bytes = os.path.getsize(tmp_out)
+
+        size = (args.image_size, args.image_size)
+        fp32 = Classifier(model, size=size)
+        # latency is compared on ONNX Runtime for both, so the gain is down to
+        # quantization alone
+        fp32_onnx = Classifier(OnnxModel(fp32_path, torch.get_num_threads()),
+                               size=size)
+        int8 = Classifier(OnnxModel(tmp_out, torch.get_num_threads()), size=size)
+        eval_data = load_split(args.eval_data)
+        fp32_accuracy = accuracy(fp32, eval_data, args.batch_size)
+        int8_accuracy = accuracy(int8, eval_data, args.batch_size)
+        drop = fp32_accuracy - int8_accuracy
+
+        report = {
+            'eval_images': len(eval_data),
+            'fp32_accuracy': round(fp32_accuracy, 4),
+            'int8_accuracy': round(int8_accuracy, 4),
+            'accuracy_drop': round(drop, 4),
+            'max_accuracy_drop': args.max_accuracy_drop,
+            'fp32_onnx_mb': round(fp32_bytes / 2 ** 20, 2),
+            'int8_onnx_mb': round(int8_bytes / 2 ** 20, 2),
+            'fp32_onnx_ms': latency(fp32_onnx, [1, 8], args.bench_iterations),
+            'int8_onnx_ms': latency(int8, [1, 8], args.bench_iterations),
+            'fp32_eager_ms': latency(fp32, [1, 8], args.bench_iterations),
+            'accepted': drop <= args.max_accuracy_drop,
+            'out': args.out if drop <= args.max_accuracy_drop else None,
+        }
+        if report['accepted']:
+            shutil.move(tmp_out, args.out)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not report['accepted']:
+        sys.exit(f'accuracy drop {drop:.4f} exceeds the budget of '
+                 f'{args.max_accuracy_drop}; no model written')
+    print(f'serve with: --backend onnx --exported {args.out}')
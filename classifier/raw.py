@@ -0,0 +1,73 @@
+import struct
+
+import numpy as np
+from PIL import Image
+
+# Raw frame upload for /predict: a 12 byte header followed by the pixels of
+# one HxWx3 uint8 image in row-major order, no encoding.
+#
+#   magic    4s  b'BSR1'
+#   height   H   (little endian)
+#   width    H
+#   channels B   always 3
+#   flags    B   bit 0: pixels are BGR (OpenCV order) rather than RGB
+#   reserved H
+CONTENT_TYPE = 'application/x-binsight-raw'
+MAGIC = b'BSR1'
+HEADER = struct.Struct('<4sHHBBH')
+FLAG_BGR = 1
+
+
+def is_raw(content_type):
+    return (content_type or '').split(';')[0].strip() == CONTENT_TYPE
+
+
+def encode_frame(frame, bgr=False, size=None):
+    """HxWx3 uint8 array -> raw payload; `size` (h, w) resizes first."""
+    frame = np.asarray(frame)
+    if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[2] != 3:
+        raise ValueError(f'expected an HxWx3 uint8 array, got {frame.dtype} '
+                         f'{frame.shape}')
+    if size is not None and frame.shape[:2] != tuple(size):
+        # resize on the client so only model-sized frames cross the wire
+        height, width = size
+        frame = np.asarray(Image.fromarray(frame).resize((width, height),
+                                                         Image.BILINEAR))
+    height, width = frame.shape[:2]
+    header = HEADER.pack(MAGIC, height, width, 3, FLAG_BGR if bgr else 0, 0)
+    return header + np.ascontiguousarray(frame).tobytes()
+
+
+def decode_frame(data):
+    """Raw payload -> HxWx3 RGB uint8 array viewing `data` (no copy)."""
+    if len(data) < HEADER.size:
+        raise ValueError('raw payload shorter than its header')
+    magic, height, width, channels, flags, _ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a raw frame payload')
+    if channels != 3:
+        raise ValueError(f'expected 3 channels, got {channels}')
+    if len(data) != HEADER.size + height * width * 3:
+        raise ValueError(f'raw payload is {len(data) - HEADER.size} bytes, '
+                         f'expected {height * width * 3} for {height}x{width}')
+    frame = np.frombuffer(data, np.uint8, offset=HEADER.size).reshape(
+        height, width, 3)
+    if flags & FLAG_BGR:
+        frame = frame[:, :, ::-1]
+    return frame
+
+
+def post_frame(url, frame, bgr=False, size=(260, 260), session=None,
+               timeout=30.0):
+    """Classify one decoded frame (e.g. from cv2) without JPEG encoding.
+
+    Returns the server's JSON response. Pass a `requests.Session` to reuse
+    the connection across frames.
+    """
+    if session is None:
+        import requests
+        session = requests
+    response = session.post(url, data=encode_frame(frame, bgr, size),
+                            headers={'Content-Type': CONTENT_TYPE},
+                            timeout=timeout)
+    return response.json()
@@ -1,28 +1,265 @@
-import requests
-from PIL import Image
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 
+import numpy as np
 import requests
-from io import BytesIO
 from PIL import Image
 
-image_path = './test.jpg'
-image = Image.open(image_path)
-
-image_io = BytesIO()
-image.save(image_io, format='JPEG')
-image_io.seek(0)
-
-# url = 'http://127.0.0.1:1117/predict'
-url = 'http://10.203.124.128:1117/predict'  # Johnson's laptop
-# url = "http://10.99.134.83:1117/predict" # Working server
-# url = 'http://10.99.68.67:1117/predict'  # Old Server
-files = {'file': ('image.jpg', image_io, 'image/jpeg')}
-response = requests.post(url, files=files)
-
-if response.status_code == 200:
-    result = response.json()
-    predicted_class = result['label']
-    predicted_prob = result['score']
-    print(f'Predicted Class: {predicted_class}, Predicted Probability: {predicted_prob}')
-else:
-    print(f'Error: {response.text}')
+from raw import CONTENT_TYPE as RAW_CONTENT_TYPE, encode_frame
+
+
+def load_images(args):
+    # payloads cycled through by the senders: encoded JPEGs, or raw frames
+    # (pre-resized to the model input unless --raw-full-size) with --raw
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, '**', '*.jp*g'),
+                                 recursive=True))
+        if not paths:
+            raise SystemExit(f'no JPEGs found under {args.images}')
+        images = []
+        for path in paths[:args.num_images]:
+            image = Image.open(path).convert('RGB')
+            if args.width and args.height:
+                image = image.resize((args.width, args.height))
+            images.append(image)
+    else:
+        rng = np.random.default_rng(0)
+        images = [Image.fromarray(rng.integers(
+                      0, 256, (args.height or 480, args.width or 640, 3),
+                      dtype=np.uint8))
+                  for _ in range(args.num_images)]
+    if args.raw:
+        size = None if args.raw_full_size else (260, 260)
+        return [encode_frame(np.asarray(image), size=size) for image in images]
+    return [encode(image) for image in images]
+
+
+def encode(image):
+    image_io = BytesIO()
+    image.save(image_io, format='JPEG', quality=90)
+    return image_io.getvalue()
+
+
+class HttpClient:
+    """Posts payloads to /predict, one keep-alive session per thread."""
+
+    def __init__(self, url, timeout, raw=False):
+        self.url = url
+        self.timeout = timeout
+        self.raw = raw
+        self._local = threading.local()
+
+    def __call__(self, payload):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        if self.raw:
+            response = session.post(self.url, data=payload,
+                                    headers={'Content-Type': RAW_CONTENT_TYPE},
+                                    timeout=self.timeout)
+        else:
+            files = {'file': ('image.jpg', payload, 'image/jpeg')}
+            response = session.post(self.url, files=files,
+                                    timeout=self.timeout)
+        result = response.json()
+        if response.status_code != 200 or 'error' in result:
+            raise RuntimeError(f'{response.status_code}: {result}')
+        return result
+
+
+class InProcessClient:
+    """Runs the server's decode + batched inference path without HTTP."""
+
+    def __init__(self, args):
+        from batching import MicroBatcher
+        from inference import load_classifier
+        from preprocess import Preprocessor
+
+        self.raw = args.raw
+        self.preprocessor = Preprocessor((260, 260), args.max_batch_size)
+        classifier = load_classifier(
+            args.model_name, args.num_classes, args.checkpoint, args.device,
+            args.backend, args.exported, args.channels_last,
+            preprocessor=self.preprocessor)
+        self.batcher = MicroBatcher(
+            lambda images: list(zip(*classifier.predict(images))),
+            args.max_batch_size, args.max_wait_ms)
+
+    def __call__(self, payload):
+        if self.raw:
+            frame = self.preprocessor.load_raw(payload)
+        else:
+            frame = self.preprocessor.load(BytesIO(payload))
+        index, confidence = self.batcher(frame)
+        return {'index': index, 'score': confidence}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        self.sample = None
+
+    def run(self, client, payload, scheduled):
+        # latency is measured from the scheduled send time, so time spent
+        # waiting for a free sender counts (no coordinated omission)
+        try:
+            result = client(payload)
+        except Exception as e:
+            with self.lock:
+                key = type(e).__name__ + ': ' + str(e)[:80]
+                self.errors[key] = self.errors.get(key, 0) + 1
+            return
+        latency = time.perf_counter() - scheduled
+        with self.lock:
+            self.latencies.append(latency)
+            if self.sample is None:
+                self.sample = result
+
+
+def closed_loop(client, payloads, recorder, args):
+    deadline = time.perf_counter() + args.duration
+    counter = iter(range(args.requests or 2 ** 62))
+    lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            recorder.run(client, payloads[i % len(payloads)],
+                         time.perf_counter())
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(client, payloads, recorder, args):
+    # Poisson arrivals at --rate requests/s, independent of response times
+    rng = np.random.default_rng(1)
+    total = args.requests or int(args.rate * args.duration)
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        scheduled = time.perf_counter()
+        for i in range(total):
+            scheduled += rng.exponential(1 / args.rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(recorder.run, client, payloads[i % len(payloads)],
+                            scheduled)
+
+
+def report(recorder, elapsed, args):
+    latencies = np.array(recorder.latencies) * 1000
+    errors = sum(recorder.errors.values())
+    total = len(latencies) + errors
+    summary = {
+        'mode': 'in-process' if args.in_process else 'http',
+        'payload': 'raw' if args.raw else 'jpeg',
+        'target': None if args.in_process else args.url,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'requests': total,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'errors': recorder.errors,
+        'sample_response': recorder.sample,
+    }
+    if len(latencies):
+        summary.update({
+            'latency_ms': {
+                'mean': round(float(latencies.mean()), 2),
+                'p50': round(float(np.percentile(latencies, 50)), 2),
+                'p95': round(float(np.percentile(latencies, 95)), 2),
+                'p99': round(float(np.percentile(latencies, 99)), 2),
+                'max': round(float(latencies.max()), 2)}})
+    return summary
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('Load test the classifier service')
+    parser.add_argument('--url', default='http://127.0.0.1:1117/predict',
+                        type=str)
+    parser.add_argument('--images', default=None, type=str,
+                        help='directory of JPEGs to send '
+                             '(default: synthetic images)')
+    parser.add_argument('--num-images', default=16, type=int,
+                        help='distinct payloads to cycle through')
+    parser.add_argument('--width', default=None, type=int,
+                        help='resize/generate images to this width')
+    parser.add_argument('--height', default=None, type=int,
+                        help='resize/generate images to this height')
+    parser.add_argument('--concurrency', default=8, type=int,
+                        help='concurrent senders (closed loop) or max '
+                             'outstanding requests (open loop)')
+    parser.add_argument('--rate', default=None, type=float,
+                        help='open loop: send this many requests/s '
+                             'regardless of response times')
+    parser.add_argument('--duration', default=30.0, type=float,
+                        help='seconds to run (default: 30)')
+    parser.add_argument('--requests', default=None, type=int,
+                        help='stop after this many requests')
+    parser.add_argument('--warmup', default=2, type=int,
+                        help='requests sent before measuring')
+    parser.add_argument('--timeout', default=30.0, type=float)
+    parser.add_argument('--output', default=None, type=str,
+                        help='also write the JSON report here')
+    parser.add_argument('--raw', action='store_true',
+                        help='send raw uint8 frames (raw.py) instead of JPEGs, '
+                             'pre-resized to 260x260')
+    parser.add_argument('--raw-full-size', action='store_true',
+                        help='with --raw, send frames at their own size and '
+                             'let the server resize')
+
+    # in-process mode: same model path as api.py, no HTTP
+    parser.add_argument('--in-process', action='store_true',
+                        help='benchmark decode + inference without a server')
+    parser.add_argument('--model_name', default='efficientnet-b2', type=str)
+    parser.add_argument('--num-classes', type=int, default=4)
+    parser.add_argument(
+        '--checkpoint',
+        default='./lightning_logs/version_2/checkpoints/epoch=14_val_acc=0.8923.ckpt')
+    parser.add_argument('--backend', default='eager', type=str)
+    parser.add_argument('--exported', default=None, type=str)
+    parser.add_argument('--device', default='cpu', type=str)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--channels-last', action='store_true')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    payloads = load_images(args)
+    client = InProcessClient(args) if args.in_process else \
+        HttpClient(args.url, args.timeout, args.raw)
+
+    for payload in payloads[:args.warmup]:
+        client(payload)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.rate:
+        open_loop(client, payloads, recorder, args)
+    else:
+        closed_loop(client, payloads, recorder, args)
+    elapsed = time.perf_counter() - start
+
+    summary = json.dumps(report(recorder, elapsed, args), indent=2)
+    print(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(summary + '\n')
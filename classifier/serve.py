@@ -0,0 +1,116 @@
+import collections
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from werkzeug.serving import make_server
+
+# exit code of a worker whose post_fork failed; restarting it would only
+# fail the same way
+POST_FORK_FAILED = 3
+
+
+def bind_socket(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, host, port, worker_id, post_fork):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if post_fork is not None:
+        try:
+            post_fork(worker_id)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(POST_FORK_FAILED)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def serve_prefork(app, host, port, workers, post_fork=None, max_restarts=5,
+                  restart_window=60.0, backoff=0.5, max_backoff=30.0):
+    """Serve `app` from `workers` forked processes sharing one listen socket.
+
+    Everything loaded before this call (e.g. the model weights) is inherited
+    by the workers copy-on-write. `post_fork(worker_id)` runs in each worker
+    before it starts accepting connections; start threads and set per-worker
+    options there, since threads do not survive a fork.
+
+    A worker that dies is restarted after an exponential backoff (`backoff`
+    seconds doubling per recent restart, up to `max_backoff`). The server
+    stops all workers and exits non-zero if a worker's `post_fork` fails or
+    one worker dies more than `max_restarts` times within `restart_window`
+    seconds.
+    """
+    sock = bind_socket(host, port)
+    children = {}
+    restarts = collections.defaultdict(collections.deque)
+    stopping = False
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, host, port, worker_id, post_fork)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = worker_id
+        print(f'worker {worker_id} started (pid {pid})')
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    def abort(message):
+        stop(None, None)
+        for pid in list(children):
+            os.waitpid(pid, 0)
+        sock.close()
+        sys.exit(message)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        if worker_id is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if code == POST_FORK_FAILED:
+            abort(f'worker {worker_id} failed to start; stopping the server')
+
+        now = time.monotonic()
+        recent = restarts[worker_id]
+        while recent and now - recent[0] > restart_window:
+            recent.popleft()
+        if len(recent) >= max_restarts:
+            abort(f'worker {worker_id} exited {len(recent) + 1} times within '
+                  f'{restart_window:.0f}s; stopping the server')
+        delay = min(backoff * 2 ** len(recent), max_backoff)
+        recent.append(now)
+        print(f'worker {worker_id} (pid {pid}) exited with code {code}, '
+              f'restarting in {delay:.1f}s')
+        time.sleep(delay)
+        if not stopping:
+            spawn(worker_id)
+    sock.close()
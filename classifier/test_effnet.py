@@ -1,15 +1,17 @@
 import os
 import argparse
+import json
+import time
 import numpy as np
 from matplotlib import pyplot as plt
 
 import torch
-from torch.autograd import Variable
 from torch.utils.data.sampler import SubsetRandomSampler
 import torchvision
 import torchvision.transforms as transforms
 
-from efficientnet_pytorch import EfficientNet
+from inference import load_classifier
+from packed_dataset import PackedDataset
 
 def get_random_images(data_dir, test_transforms, num=10):
     data = torchvision.datasets.ImageFolder(data_dir,
@@ -26,15 +28,43 @@ def get_random_images(data_dir, test_transforms, num=10):
     return images, labels, classes
 
 
-def predict_image(image, model, device):
-    image_tensor = test_transforms(image).float().to(device)
-    image_tensor = image_tensor.unsqueeze_(0)
-    input_img = Variable(image_tensor)
-    input_img = input_img.to(device)
-    model.to(device)
-    output = model(input_img)
-    index = output.data.cpu().numpy().argmax()
-    return index
+def evaluate(classifier, data, args):
+    """Runs the whole split through batched forward passes."""
+    loader = torch.utils.data.DataLoader(
+        data, batch_size=args.batch_size, num_workers=args.workers,
+        pin_memory=args.device.startswith('cuda'))
+    num_classes = len(data.classes)
+    confusion = np.zeros((num_classes, num_classes), np.int64)
+    model_time = 0.0
+
+    start = time.perf_counter()
+    for images, labels in loader:
+        model_start = time.perf_counter()
+        preds, _ = classifier.predict_tensor(images)
+        model_time += time.perf_counter() - model_start
+        np.add.at(confusion, (labels.numpy(), preds), 1)
+    elapsed = time.perf_counter() - start
+
+    total = int(confusion.sum())
+    correct = np.diag(confusion)
+    support = confusion.sum(axis=1)
+    return {
+        'checkpoint': args.checkpoint,
+        'backend': args.backend,
+        'data': args.packed or args.data_img,
+        'images': total,
+        'accuracy': round(float(correct.sum() / max(total, 1)), 4),
+        'per_class_accuracy': {
+            name: round(float(correct[i] / support[i]), 4) if support[i] else None
+            for i, name in enumerate(data.classes)},
+        'classes': data.classes,
+        'confusion_matrix': confusion.tolist(),
+        'batch_size': args.batch_size,
+        'workers': args.workers,
+        'elapsed_s': round(elapsed, 3),
+        'images_per_s': round(total / elapsed, 2),
+        'model_images_per_s': round(total / model_time, 2) if model_time else None,
+    }
 
 
 def get_args_parser():
@@ -73,8 +103,28 @@ def get_args_parser():
                         default=5, type=int)
     parser.add_argument('--device', help='specify device to use',
                         default="cpu", type=str)
-    
-    
+    parser.add_argument('--channels-last', action='store_true',
+                        help='run the model in channels_last memory format')
+
+    # evaluation mode: the whole split, batched, no figure
+    parser.add_argument('--eval', action='store_true',
+                        help='evaluate the whole split and write JSON '
+                             'instead of plotting --num samples')
+    parser.add_argument('--batch-size', default=32, type=int,
+                        help='evaluation batch size (default: 32)')
+    parser.add_argument('--workers', default=4, type=int,
+                        help='DataLoader worker processes (default: 4)')
+    parser.add_argument('--backend', default='eager', type=str,
+                        help='eager, torchscript or onnx (default: eager)')
+    parser.add_argument('--exported', default=None, type=str,
+                        help='exported model for the torchscript/onnx backends')
+    parser.add_argument('--packed', default=None, type=str,
+                        help='evaluate a split packed by packed_dataset.py '
+                             'instead of decoding --data_img')
+    parser.add_argument('--json', default=None, type=str,
+                        help='where to write the evaluation results '
+                             '(default: <out>/eval.json)')
+
     return parser
 
 
@@ -87,23 +137,29 @@ if __name__ == '__main__':
     test_transforms = transforms.Compose([transforms.Resize((260, 260)),
                                             transforms.ToTensor(),
                                             ])
-    model = EfficientNet.from_pretrained(
-            args.model_name,
-            num_classes=args.num_classes)
-    checkpoint = torch.load(args.checkpoint)
+    classifier = load_classifier(args.model_name, args.num_classes,
+                                 args.checkpoint, args.device, args.backend,
+                                 args.exported, args.channels_last)
+    if args.eval:
+        if args.packed:
+            data = PackedDataset(args.packed)
+        else:
+            data = torchvision.datasets.ImageFolder(args.data_img,
+                                                    transform=test_transforms)
+        results = evaluate(classifier, data, args)
+        print(json.dumps(results, indent=2))
+        path = args.json or os.path.join(args.out, 'eval.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        raise SystemExit
 
-    new_checkpoint = {}
-    for k, v in checkpoint['state_dict'].items():
-        new_checkpoint[k.replace('efficient_net.', '')] = v
-    
-    model.load_state_dict(new_checkpoint)
-    model.eval()
     images, labels, gt_cl = get_random_images(args.data_img,
                                                 test_transforms, args.num)
+    indices, _ = classifier.predict_tensor(images)
     fig = plt.figure(figsize=(10, 10))
     for ii in range(len(images)):
         image = to_pil(images[ii])
-        index = predict_image(image, model, args.device)
+        index = indices[ii]
         sub = fig.add_subplot(len(images), 1, ii + 1)
         res = int(labels[ii]) == index
         sub.set_title("GT: " + str(gt_cl[labels[ii]]) +
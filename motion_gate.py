@@ -0,0 +1,48 @@
+import cv2
+
+
+class MotionGate:
+    """Decides whether a frame differs enough to be worth running a detector.
+
+    Frames are shrunk to `width` pixels wide grayscale and compared with the
+    frame the detector last ran on, using the mean absolute pixel difference
+    (like `frameDifference` in the capture page). The detector runs when that
+    exceeds `threshold` gray levels, or at least every `refresh_every` frames
+    so slow drift and lighting changes are caught.
+    A threshold of 0 runs the detector on every frame.
+    """
+
+    def __init__(self, threshold=4.0, refresh_every=15, width=64):
+        self.threshold = threshold
+        self.refresh_every = refresh_every
+        self.width = width
+        self.reference = None
+        self.since_run = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def _small(self, image):
+        height, width = image.shape[:2]
+        size = (self.width, max(1, round(self.width * height / width)))
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    def should_run(self, image):
+        self.frames += 1
+        small = self._small(image)
+        run = (self.reference is None
+               or self.threshold <= 0
+               or self.since_run + 1 >= self.refresh_every
+               or small.shape != self.reference.shape
+               or cv2.absdiff(small, self.reference).mean() > self.threshold)
+        if run:
+            self.reference = small
+            self.since_run = 0
+        else:
+            self.since_run += 1
+            self.skipped += 1
+        return run
+
+    @property
+    def skipped_fraction(self):
+        return self.skipped / self.frames if self.frames else 0.0
@@ -0,0 +1,199 @@
+import argparse
+import json
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from motion_gate import MotionGate
+from tracker import StabilityTracker
+from video_parse import OBJECT_NAMES, roi_bounds, trash_detections
+from video_pipeline import Capture, LatestSlot, open_source
+
+
+class Stream:
+    """One camera or file: its capture thread, ROI, tracker and counters."""
+
+    def __init__(self, name, source, stop_event, gate=None):
+        self.name = name
+        self.frames = LatestSlot()
+        self.capture = Capture(source, self.frames, stop_event)
+        self.gate = gate
+        self.bounds = None
+        self.tracker = None
+        self.last_detections = (np.empty((0, 4), int), np.empty(0, int))
+        self.processed = 0
+        self.detected = 0
+        self.closed = False
+
+    def setup(self, frame):
+        self.bounds = roi_bounds(*frame.shape[:2])
+        x1, y1, x2, y2 = self.bounds
+        # Dynamic stability threshold based on the size of the ROI
+        self.tracker = StabilityTracker(
+            stable_distance=np.sqrt((x2 - x1) * (y2 - y1)) * 0.1)
+
+    def roi(self, image):
+        x1, y1, x2, y2 = self.bounds
+        return image[y1:y2, x1:x2]
+
+    def stats(self, elapsed):
+        return {'source': self.name,
+                'capture_fps': round(self.capture.captured / elapsed, 2),
+                'detect_fps': round(self.processed / elapsed, 2),
+                'frames_captured': self.capture.captured,
+                'frames_processed': self.processed,
+                'frames_dropped': self.frames.dropped,
+                'detector_frames': self.detected}
+
+
+class MultiCameraRunner:
+    """Runs one YOLO model over several sources with one batched call per tick.
+
+    Each source is read on its own capture thread into a `LatestSlot`. Every
+    tick the newest unseen frame of each source is taken, ROIs whose motion
+    gate fires are stacked into a single detector call, and the detections
+    are routed back to that source's tracker. Objects that hold still for
+    more than `stable_frames` frames produce one event per track, passed to
+    `on_event`.
+    """
+
+    def __init__(self, sources, model, stable_frames=5, display=False,
+                 duration=None, gate_args=None, on_event=None):
+        self.model = model
+        self.stable_frames = stable_frames
+        self.display = display
+        self.duration = duration
+        self.on_event = on_event or (lambda event: None)
+        self.stop_event = threading.Event()
+        self.streams = [
+            Stream(str(spec), open_source(spec), self.stop_event,
+                   MotionGate(*gate_args) if gate_args else None)
+            for spec in sources]
+        self.ticks = 0
+        self.batches = []
+
+    def _collect(self):
+        # newest unseen frame from every source that has one, without waiting
+        # on slower sources
+        ready = []
+        for stream in self.streams:
+            if stream.closed:
+                continue
+            frame = stream.frames.get(timeout=0)
+            if frame is not None:
+                ready.append((stream, frame))
+            elif not stream.capture.is_alive():
+                stream.closed = True
+        return ready
+
+    def step(self, ready):
+        batch = []
+        for stream, frame in ready:
+            if stream.bounds is None:
+                stream.setup(frame.image)
+            roi_frame = stream.roi(frame.image)
+            if stream.gate is None or stream.gate.should_run(roi_frame):
+                batch.append((stream, roi_frame))
+
+        # one detector call for every source that needs one this tick
+        if batch:
+            results = self.model([roi for _, roi in batch], verbose=False)
+            for (stream, _), result in zip(batch, results):
+                stream.last_detections = trash_detections(result, stream.bounds)
+                stream.detected += 1
+            self.batches.append(len(batch))
+
+        for stream, frame in ready:
+            boxes, clss = stream.last_detections
+            track_ids, stable_counts = stream.tracker.update(boxes, clss)
+            for i in np.flatnonzero(stable_counts == self.stable_frames + 1):
+                self.on_event({'event': 'stable', 'source': stream.name,
+                               'frame': frame.index, 'time': time.time(),
+                               'track_id': int(track_ids[i]),
+                               'object': OBJECT_NAMES[clss[i]],
+                               'box': boxes[i].tolist()})
+            stream.processed += 1
+            if self.display:
+                image = frame.image
+                x1, y1, x2, y2 = stream.bounds
+                cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 0), 2)
+                for bx1, by1, bx2, by2 in boxes:
+                    cv2.rectangle(image, (bx1, by1), (bx2, by2), (0, 255, 0), 2)
+                cv2.imshow(stream.name, image)
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        for stream in self.streams:
+            stream.capture.start()
+        try:
+            while not all(stream.closed for stream in self.streams):
+                if self.duration and \
+                        time.perf_counter() - self.started_at > self.duration:
+                    break
+                ready = self._collect()
+                if ready:
+                    self.step(ready)
+                    self.ticks += 1
+                else:
+                    time.sleep(0.002)
+                if self.display and cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            self.stop_event.set()
+            for stream in self.streams:
+                stream.capture.join(timeout=5)
+                stream.capture.source.release()
+            self.elapsed = time.perf_counter() - self.started_at
+            if self.display:
+                cv2.destroyAllWindows()
+
+    def stats(self):
+        streams = [stream.stats(self.elapsed) for stream in self.streams]
+        return {'streams': streams,
+                'aggregate_detect_fps': round(
+                    sum(s['detect_fps'] for s in streams), 2),
+                'ticks': self.ticks,
+                'mean_detector_batch': round(float(np.mean(self.batches)), 2)
+                if self.batches else 0.0}
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Detect stable trash objects in several cameras with one model')
+    parser.add_argument('sources', nargs='+',
+                        help='camera indexes, video files or image directories')
+    parser.add_argument('--duration', default=None, type=float,
+                        help='stop after this many seconds (default: run '
+                             'until every source ends)')
+    parser.add_argument('--display', action='store_true',
+                        help='show one window per source')
+    parser.add_argument('--stable-frames', default=5, type=int,
+                        help='frames an object must hold still before it is '
+                             'reported (default: 5)')
+    parser.add_argument('--motion-threshold', default=4.0, type=float,
+                        help='mean gray-level change in a ROI needed to '
+                             're-run the detector on it, 0 runs it on every '
+                             'frame (default: 4)')
+    parser.add_argument('--refresh-every', default=15, type=int,
+                        help='run the detector on each source at least every '
+                             'N frames (default: 15)')
+    parser.add_argument('--detector', default='yolov8n.pt', type=str)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    def emit(event):
+        print(json.dumps(event), flush=True)
+
+    runner = MultiCameraRunner(
+        args.sources, YOLO(args.detector), args.stable_frames,
+        display=args.display, duration=args.duration,
+        gate_args=(args.motion_threshold, args.refresh_every), on_event=emit)
+    runner.run()
+    print(json.dumps({'event': 'stats', **runner.stats()}), file=sys.stderr)
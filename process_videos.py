@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from track_labels import add_track_label_args, track_labels_factory
+from video_to_pred_demo import OBJECT_NAMES, DetectClassifyEngine, load_classifier
+
+
+class ReadAhead:
+    """Decodes a video file on a background thread into a bounded queue."""
+
+    def __init__(self, path, size=64, stride=1):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f'cannot open {path}')
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.stride = stride
+        self.queue = queue.Queue(maxsize=size)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        index = 0
+        try:
+            while not self.stop_event.is_set():
+                if index % self.stride:
+                    ok = self.capture.grab()
+                else:
+                    ok, frame = self.capture.read()
+                    if ok:
+                        self.queue.put((index, frame))
+                if not ok:
+                    break
+                index += 1
+        finally:
+            self.capture.release()
+            self.frames = index
+            self.queue.put(None)
+
+    def batches(self, batch_size):
+        batch = []
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.stop_event.set()
+        # drain so a reader blocked on the full queue can see the stop
+        while self.thread.is_alive():
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.thread.join(timeout=0.05)
+
+
+class RecordWriter:
+    """JSON lines, or Parquet (via pandas) when the path ends in .parquet."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self.rows = []
+        self.file = None if self.parquet else open(path, 'w')
+
+    def write(self, record):
+        if self.parquet:
+            self.rows.append(record)
+        else:
+            self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.parquet:
+            import pandas as pd
+            pd.DataFrame(self.rows).to_parquet(self.path, index=False)
+        else:
+            self.file.close()
+
+
+_engine = None
+
+
+def init_process(args, threads):
+    global _engine
+    classifier = load_classifier(args.model_name, args.num_classes,
+                                 args.checkpoint, args.device,
+                                 num_threads=threads,
+                                 max_batch_size=args.batch_size)
+    _engine = DetectClassifyEngine(classifier,
+                                   stable_frames=args.stable_frames,
+                                   detector=args.detector,
+                                   labels=track_labels_factory(args))
+
+
+def process_video(path, args):
+    """Runs detect -> track -> classify over one file and writes its log."""
+    engine = _engine
+    engine.reset()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    output = os.path.join(args.output_dir, stem + '.' + args.format)
+    start = time.perf_counter()
+    reader = ReadAhead(path, args.read_ahead, args.stride)
+    writer = None
+    processed = detections = classified = 0
+    try:
+        writer = RecordWriter(output)
+        for batch in reader.batches(args.batch_size):
+            frames = [frame for _, frame in batch]
+            pending = []
+            for (index, frame), (boxes, clss) in zip(
+                    batch, engine.detect_batch(frames)):
+                track_ids, ready = engine.track(index, frame, boxes, clss)
+                pending.extend(ready)
+                for box, cls, track_id in zip(boxes, clss, track_ids):
+                    writer.write({'event': 'detection', 'video': stem,
+                                  'frame': index,
+                                  'time_s': round(index / reader.fps, 3),
+                                  'track_id': int(track_id),
+                                  'object': OBJECT_NAMES[int(cls)],
+                                  'box': box.tolist()})
+                detections += len(boxes)
+            for event in engine.label(pending):
+                event['video'] = stem
+                event['time_s'] = round(event['frame'] / reader.fps, 3)
+                del event['time']
+                writer.write(event)
+                classified += 1
+            processed += len(batch)
+    finally:
+        # flush what was logged and stop the decoder even if a batch failed
+        reader.close()
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    duration = reader.frames / reader.fps
+    return {'video': path, 'output': output,
+            'frames': reader.frames, 'frames_processed': processed,
+            'detections': detections, 'classified': classified,
+            **engine.labels.stats(),
+            'video_s': round(duration, 2), 'elapsed_s': round(elapsed, 2),
+            'fps': round(processed / elapsed, 2) if elapsed else 0.0,
+            'x_realtime': round(duration / elapsed, 2) if elapsed else 0.0}
+
+
+def run_worker(path, args, threads):
+    if _engine is None:
+        init_process(args, threads)
+    return process_video(path, args)
+
+
+def failed(path, error):
+    return {'video': path, 'error': f'{type(error).__name__}: {error}'}
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Run detection and classification over recorded videos')
+    parser.add_argument('videos', nargs='+',
+                        help='video files to process')
+    parser.add_argument('--output-dir', default='./video_logs', type=str,
+                        help='one log per video is written here '
+                             '(default: ./video_logs)')
+    parser.add_argument('--format', default='jsonl',
+                        choices=['jsonl', 'parquet'],
+                        help='log format; parquet needs pandas + pyarrow')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='videos processed in parallel, one process '
+                             'each (default: 1)')
+    parser.add_argument('--batch-size', default=8, type=int,
+                        help='frames per detector call (default: 8)')
+    parser.add_argument('--read-ahead', default=64, type=int,
+                        help='decoded frames buffered ahead (default: 64)')
+    parser.add_argument('--stride', default=1, type=int,
+                        help='process every Nth frame (default: 1)')
+    parser.add_argument('--stable-frames', default=5, type=int,
+                        help='frames an object must hold still before it is '
+                             'classified (default: 5)')
+    parser.add_argument('--detector', default='yolov8n.pt', type=str)
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model to use (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=5, metavar='NUM',
+        help='number of classes to classify (default: 5)')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./classifier/lightning_logs/version_0/checkpoints/effnet.ckpt')
+    parser.add_argument('--device', help='specify device to use',
+                        default="cpu", type=str)
+    add_track_label_args(parser)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    threads = max(1, (os.cpu_count() or 1) // args.jobs)
+
+    start = time.perf_counter()
+    summaries = []
+    if args.jobs == 1:
+        for path in args.videos:
+            try:
+                summaries.append(run_worker(path, args, threads))
+            except Exception as e:
+                summaries.append(failed(path, e))
+            print(json.dumps(summaries[-1]))
+    else:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            futures = {executor.submit(run_worker, path, args, threads): path
+                       for path in args.videos}
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    summaries.append(failed(futures[future], e))
+                print(json.dumps(summaries[-1]))
+
+    elapsed = time.perf_counter() - start
+    video_s = sum(s.get('video_s', 0.0) for s in summaries)
+    print(json.dumps({'videos': len(summaries),
+                      'video_s': round(video_s, 2),
+                      'elapsed_s': round(elapsed, 2),
+                      'x_realtime': round(video_s / elapsed, 2)}))
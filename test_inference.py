@@ -1,34 +1,12 @@
 import os
+import sys
 import argparse
 from PIL import Image, ImageTk
-import torch
-from torch.autograd import Variable
-import torchvision.transforms as transforms
-from efficientnet_pytorch import EfficientNet
 import tkinter as tk
 from tkinter import Label, PhotoImage
 
-def load_model(model_name, num_classes, checkpoint_path):
-    model = EfficientNet.from_pretrained(model_name, num_classes=num_classes)
-    checkpoint = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-    new_checkpoint = {}
-    for k, v in checkpoint['state_dict'].items():
-        new_checkpoint[k.replace('efficient_net.', '')] = v
-    model.load_state_dict(new_checkpoint)
-    model.eval()
-    return model
-
-def predict_image(image, model, device):
-    image_tensor = test_transforms(image).float().to(device)
-    image_tensor = image_tensor.unsqueeze_(0)
-    input_img = Variable(image_tensor)
-    input_img = input_img.to(device)
-    model.to(device)
-    output = model(input_img)
-    prob = torch.nn.functional.softmax(output, dim=1)
-    index = output.data.cpu().numpy().argmax()
-    confidence = prob[0][index].item()
-    return index, confidence
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier'))
+from inference import load_classifier
 
 def display_result(input_image, predicted_class, confidence):
     root = tk.Tk()
@@ -77,10 +55,8 @@ def get_args_parser():
 
 if __name__ == '__main__':
     args = get_args_parser().parse_args()
-    test_transforms = transforms.Compose([transforms.Resize((260, 260)), transforms.ToTensor()])
-    model = load_model(args.model_name, args.num_classes, args.checkpoint)
-    image = Image.open(args.input_image)
-    index, confidence = predict_image(image, model, args.device)
+    classifier = load_classifier(args.model_name, args.num_classes, args.checkpoint, args.device)
+    (index,), (confidence,) = classifier.predict([Image.open(args.input_image)])
     classes = ['Bio', 'Glass', 'Metals-and-plastics', 'Non-recyclable', 'Paper']
     predicted_class = classes[index]
     display_result(args.input_image, predicted_class, confidence)
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from track_labels import TrackLabels
+
+
+def crop(value=100):
+    return np.full((32, 32, 3), value, np.uint8)
+
+
+def test_expired_while_pending_is_still_labelled():
+    labels = TrackLabels()
+    assert labels.needs(7, crop())
+    # the tracker drops the track before its batch is classified
+    labels.expire([])
+    assert labels.add(7, 'Glass', 0.9, crop()) == ('Glass', 0.9, True)
+    labels.expire([])
+    assert labels.get(7) is None
+
+
+def test_confident_track_is_not_reclassified():
+    labels = TrackLabels(min_confidence=0.6)
+    assert labels.needs(1, crop())
+    labels.add(1, 'Paper', 0.8, crop())
+    assert not labels.needs(1, crop())
+    assert labels.needs(1, crop(200))
+    assert labels.stats()['classifier_calls_saved'] == 1
+
+
+class FixedClassifier:
+    def predict(self, images):
+        return [1] * len(images), [0.9] * len(images)
+
+
+class NoDetector:
+    def __call__(self, frames, verbose=False):
+        raise AssertionError('the test feeds detections to track() directly')
+
+
+def test_engine_track_dropped_between_track_and_label():
+    pytest.importorskip('ultralytics')
+    from video_to_pred_demo import DetectClassifyEngine
+
+    engine = DetectClassifyEngine(FixedClassifier(), stable_frames=0,
+                                  detector=NoDetector(),
+                                  classes=['Bio', 'Glass'])
+
+    frame = np.zeros((96, 128, 3), np.uint8)
+    box = np.array([[10, 10, 60, 60]])
+    pending = []
+    for index in range(2):
+        pending += engine.track(index, frame, box, np.array([39]))[1]
+    # the object leaves until the tracker forgets it, all within one batch
+    for index in range(2, 2 + engine.tracker.max_misses + 1):
+        pending += engine.track(index, frame, np.empty((0, 4), int),
+                                np.empty(0, int))[1]
+    assert len(engine.tracker) == 0
+
+    events = engine.label(pending)
+    assert [event['label'] for event in events] == ['Glass']
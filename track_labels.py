@@ -0,0 +1,118 @@
+import functools
+
+import cv2
+import numpy as np
+
+
+class TrackLabels:
+    """Classifier results attached to tracker identities.
+
+    A track is classified when it first becomes stable. It is classified
+    again only while its label is still uncertain (best vote confidence below
+    `min_confidence`, up to `max_votes` crops) or when its crop has changed
+    materially since the last classification (mean absolute difference of
+    `thumb` x `thumb` grayscale thumbnails above `change_threshold`), which
+    resets its votes. Votes are summed confidences per class.
+
+    `calls` counts crops sent to the classifier; `saved` counts stable
+    sightings that reused the track's label instead.
+    """
+
+    def __init__(self, min_confidence=0.6, max_votes=3, change_threshold=12.0,
+                 thumb=16):
+        self.min_confidence = min_confidence
+        self.max_votes = max_votes
+        self.change_threshold = change_threshold
+        self.thumb = thumb
+        self.tracks = {}
+        self.calls = 0
+        self.saved = 0
+        self.labelled = 0
+
+    def _thumbnail(self, crop):
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (self.thumb, self.thumb),
+                          interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def _state(self, track_id):
+        return self.tracks.setdefault(
+            track_id, {'votes': {}, 'count': 0, 'label': None,
+                       'confidence': 0.0, 'pending': False})
+
+    def needs(self, track_id, crop):
+        """Whether this sighting of a stable track should be classified.
+
+        A True answer marks the track as pending until `add` is called, so
+        later sightings in the same batch reuse that classification.
+        """
+        state = self._state(track_id)
+        if state['pending']:
+            run = False
+        elif not state['votes']:
+            run = True
+        elif cv2.absdiff(self._thumbnail(crop), state['thumb']).mean() \
+                > self.change_threshold:
+            state['votes'] = {}
+            state['count'] = 0
+            run = True
+        else:
+            run = state['confidence'] < self.min_confidence \
+                and state['count'] < self.max_votes
+        if run:
+            state['pending'] = True
+        else:
+            self.saved += 1
+        return run
+
+    def add(self, track_id, label, confidence, crop):
+        """Record one classification; returns (label, confidence, changed)."""
+        self.calls += 1
+        state = self._state(track_id)
+        state['pending'] = False
+        if state['label'] is None:
+            self.labelled += 1
+        state['votes'][label] = state['votes'].get(label, 0.0) + confidence
+        state['count'] += 1
+        state['thumb'] = self._thumbnail(crop)
+        previous = state['label']
+        state['label'] = max(state['votes'], key=state['votes'].get)
+        state['confidence'] = state['votes'][state['label']] / state['count']
+        return state['label'], state['confidence'], state['label'] != previous
+
+    def get(self, track_id):
+        state = self.tracks.get(track_id)
+        if state is None or state['label'] is None:
+            return None
+        return state['label'], state['confidence']
+
+    def expire(self, alive):
+        # a track still waiting on its classification (the batch is labelled
+        # after the tracker may have dropped it) is kept until `add`
+        alive = set(alive)
+        self.tracks = {k: v for k, v in self.tracks.items()
+                       if k in alive or v['pending']}
+
+    def stats(self):
+        return {'classifier_calls': self.calls,
+                'classifier_calls_saved': self.saved,
+                'tracks_labelled': self.labelled,
+                'calls_per_track': round(self.calls / self.labelled, 2)
+                if self.labelled else 0.0}
+
+
+def add_track_label_args(parser):
+    parser.add_argument('--min-confidence', default=0.6, type=float,
+                        help='re-classify a track while its label confidence '
+                             'is below this (default: 0.6)')
+    parser.add_argument('--max-votes', default=3, type=int,
+                        help='most crops classified per track while its label '
+                             'is uncertain (default: 3)')
+    parser.add_argument('--change-threshold', default=12.0, type=float,
+                        help='mean gray-level change of a track\'s crop that '
+                             'triggers re-classification (default: 12)')
+    return parser
+
+
+def track_labels_factory(args):
+    return functools.partial(TrackLabels, args.min_confidence, args.max_votes,
+                             args.change_threshold)
@@ -0,0 +1,117 @@
+import errno
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tqdm
+
+MODES = ('copy', 'hardlink', 'reflink')
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """Copy-on-write clone (btrfs, XFS); falls back to a copy elsewhere."""
+    try:
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except (ImportError, OSError):
+        shutil.copyfile(src, dst)
+
+
+def hardlink(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        # different filesystem, or links not supported
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copyfile(src, dst)
+
+
+def place(src, dst, mode='copy'):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'hardlink':
+        hardlink(src, dst)
+    elif mode == 'reflink':
+        reflink(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+
+class Manifest:
+    """Append-only list of finished destination paths.
+
+    A file is recorded only after it has been placed, so rerunning an
+    interrupted conversion skips everything already done and redoes any file
+    that was half written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = open(path, 'a')
+
+    def __contains__(self, dst):
+        return dst in self.done
+
+    def record(self, dst):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(dst + '\n')
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def convert(jobs, mode='copy', workers=16, manifest=None):
+    """Places every (src, dst) pair using a thread pool; returns counts."""
+    manifest = Manifest(manifest)
+    jobs = list(jobs)
+    todo = [(src, dst) for src, dst in jobs if dst not in manifest]
+    for folder in {os.path.dirname(dst) for _, dst in todo}:
+        os.makedirs(folder, exist_ok=True)
+
+    def run(job):
+        src, dst = job
+        place(src, dst, mode)
+        manifest.record(dst)
+
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            for _ in tqdm.tqdm(executor.map(run, todo), total=len(todo)):
+                pass
+    finally:
+        manifest.close()
+    return {'placed': len(todo), 'skipped': len(jobs) - len(todo)}
+
+
+def add_convert_args(parser):
+    parser.add_argument('--mode', default='copy', choices=MODES,
+                        help='how files are placed in the new layout; '
+                             'hardlink/reflink fall back to a copy where '
+                             'unsupported (default: copy)')
+    parser.add_argument('--workers', default=16, type=int,
+                        help='threads doing file I/O (default: 16)')
+    parser.add_argument('--manifest', default=None, type=str,
+                        help='record finished files here and skip them when '
+                             'rerun (default: <dest>/.manifest)')
+    return parser
+
+
+def manifest_path(args, dest):
+    return args.manifest or os.path.join(dest, '.manifest')
@@ -1,27 +1,44 @@
 import os
-import tqdm
 import json
-import shutil
-
-# Load the COCO format annotation JSON file
-with open('/data/yucheng/AI_System/Reference/detect-waste/annotations/annotations_detectwaste_train.json', 'r') as f:
-    annotations = json.load(f)
-
-# Create a dictionary to map category IDs to category names
-categories = {}
-for category in annotations['categories']:
-    categories[category['id']] = category['supercategory']
-# 
-# Move images to new folders and rename them
-
-image_id_to_category_id = {item['image_id']: item['category_id'] for item in annotations['annotations']}
-
-for image in tqdm.tqdm(annotations['images']):
-    
-    category_name = categories[image_id_to_category_id[image['id']]]
-    original_folder_name = os.path.basename(os.path.dirname(image['file_name']))
-    new_folder_name = os.path.join('/data/yucheng/AI_System/Dataset/DetectWaste/train', category_name)
-    os.makedirs(new_folder_name, exist_ok=True)
-    new_file_name = os.path.join(new_folder_name, original_folder_name + '_' + os.path.basename(image['file_name']))
-    shutil.copy('/data/yucheng/AI_System/Dataset/Reference/TACO/data/'+image['file_name'], new_file_name)
-    image['file_name'] = new_file_name
+import argparse
+
+from convert import add_convert_args, convert, manifest_path
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Sort TACO images into DetectWaste category folders')
+    parser.add_argument(
+        '--annotations',
+        default='/data/yucheng/AI_System/Reference/detect-waste/annotations/annotations_detectwaste_train.json',
+        help='DetectWaste COCO annotation JSON')
+    parser.add_argument('--src', default='/data/yucheng/AI_System/Dataset/Reference/TACO/data/',
+                        help='TACO data directory')
+    parser.add_argument('--dest', default='/data/yucheng/AI_System/Dataset/DetectWaste/train',
+                        help='output directory, one folder per category')
+    return add_convert_args(parser)
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    # Load the COCO format annotation JSON file
+    with open(args.annotations, 'r') as f:
+        annotations = json.load(f)
+
+    # Create a dictionary to map category IDs to category names
+    categories = {}
+    for category in annotations['categories']:
+        categories[category['id']] = category['supercategory']
+
+    image_id_to_category_id = {item['image_id']: item['category_id'] for item in annotations['annotations']}
+
+    # Rename images to <original folder>_<file name> inside their category
+    jobs = []
+    for image in annotations['images']:
+        category_name = categories[image_id_to_category_id[image['id']]]
+        original_folder_name = os.path.basename(os.path.dirname(image['file_name']))
+        new_file_name = os.path.join(args.dest, category_name, original_folder_name + '_' + os.path.basename(image['file_name']))
+        jobs.append((os.path.join(args.src, image['file_name']), new_file_name))
+
+    print(convert(jobs, args.mode, args.workers, manifest_path(args, args.dest)))
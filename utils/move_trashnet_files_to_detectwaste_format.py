@@ -1,40 +1,41 @@
 import os, glob
-import tqdm
-import json
-import shutil
-
-# Load the COCO format annotation JSON file
-with open('/data/yucheng/AI_System/Dataset/Reference/trashnet/data/one-indexed-files-notrash_train.txt', 'r') as f:
-    train_images = f.readlines()
-    train_images_name = [i.split(' ')[0].strip() for i in train_images]
-
-with open('/data/yucheng/AI_System/Dataset/Reference/trashnet/data/one-indexed-files-notrash_val.txt', 'r') as f:
-    val_images = f.readlines()
-    val_images_name = [i.split(' ')[0].strip() for i in val_images]
-
-with open('/data/yucheng/AI_System/Dataset/Reference/trashnet/data/one-indexed-files-notrash_test.txt', 'r') as f:
-    test_images = f.readlines()
-    test_images_name = [i.split(' ')[0].strip() for i in test_images]
-import ipdb; ipdb.set_trace()
-categories = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
-
-# Move images to new folders and rename them
-all_images = glob.glob('/data/yucheng/AI_System/Dataset/Reference/trashnet/data/dataset-resized/*/*.jpg')
-for image in tqdm.tqdm(all_images):
-    category_name = image.split('/')[-2].strip()
-    image_name = image.split('/')[-1].strip()
-
-    if image_name in train_images_name:
-        subset = 'train'
-    elif image_name in val_images_name:
-        subset = 'val'
-    elif image_name in test_images_name:
-        subset = 'test'
-    else:
-        raise ValueError('Image not found in any subset')
-    
-    new_folder_name = os.path.join('/data/yucheng/AI_System/Dataset/TrashNet', subset, category_name)
-    os.makedirs(new_folder_name, exist_ok=True)
-    new_file_name = os.path.join(new_folder_name, image_name)
-
-    shutil.copy('/data/yucheng/AI_System/Dataset/Reference/trashnet/data/dataset-resized/'+category_name+'/'+image_name, new_file_name)
+import argparse
+
+from convert import add_convert_args, convert, manifest_path
+
+
+def read_split(path):
+    with open(path, 'r') as f:
+        return [line.split(' ')[0].strip() for line in f if line.strip()]
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Sort TrashNet images into train/val/test category folders')
+    parser.add_argument('--src', default='/data/yucheng/AI_System/Dataset/Reference/trashnet/data',
+                        help='TrashNet data directory with the split lists '
+                             'and dataset-resized/')
+    parser.add_argument('--dest', default='/data/yucheng/AI_System/Dataset/TrashNet',
+                        help='output directory')
+    return add_convert_args(parser)
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    # image name -> subset, so each lookup is O(1)
+    subsets = {}
+    for subset in ('train', 'val', 'test'):
+        split = os.path.join(args.src, f'one-indexed-files-notrash_{subset}.txt')
+        for image_name in read_split(split):
+            subsets.setdefault(image_name, subset)
+
+    jobs = []
+    for image in glob.glob(os.path.join(args.src, 'dataset-resized', '*', '*.jpg')):
+        category_name = os.path.basename(os.path.dirname(image))
+        image_name = os.path.basename(image)
+        if image_name not in subsets:
+            raise ValueError(f'Image {image_name} not found in any subset')
+        jobs.append((image, os.path.join(args.dest, subsets[image_name], category_name, image_name)))
+
+    print(convert(jobs, args.mode, args.workers, manifest_path(args, args.dest)))
@@ -1,18 +1,32 @@
 import os
-import tqdm
 import csv
-import shutil
-
-# Load the COCO format annotation JSON file
-image_dict = {}
-with open('/data/yucheng/AI_System/Dataset/Reference/v4/validation_annotations.csv', newline='') as csvfile:
-    spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-    for row in spamreader:
-        image_dict[row[1].split('/')[-1]] = row[2]
-
-for image_name, category_name in tqdm.tqdm(image_dict.items()):
-    
-    new_folder_name = os.path.join('/data/yucheng/AI_System/Dataset/WasteSorting/val', category_name)
-    os.makedirs(new_folder_name, exist_ok=True)
-    shutil.copy('/data/yucheng/AI_System/Dataset/Reference/v4/valid/'+image_name, new_folder_name)
-    
\ No newline at end of file
+import argparse
+
+from convert import add_convert_args, convert, manifest_path
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Sort WasteSorting images into category folders')
+    parser.add_argument('--annotations', default='/data/yucheng/AI_System/Dataset/Reference/v4/validation_annotations.csv',
+                        help='CSV of image path and category')
+    parser.add_argument('--src', default='/data/yucheng/AI_System/Dataset/Reference/v4/valid/',
+                        help='directory holding the images')
+    parser.add_argument('--dest', default='/data/yucheng/AI_System/Dataset/WasteSorting/val',
+                        help='output directory, one folder per category')
+    return add_convert_args(parser)
+
+
+if __name__ == '__main__':
+    args = get_args_parser().parse_args()
+
+    image_dict = {}
+    with open(args.annotations, newline='') as csvfile:
+        spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        for row in spamreader:
+            image_dict[row[1].split('/')[-1]] = row[2]
+
+    jobs = [(os.path.join(args.src, image_name), os.path.join(args.dest, category_name, image_name))
+            for image_name, category_name in image_dict.items()]
+
+    print(convert(jobs, args.mode, args.workers, manifest_path(args, args.dest)))
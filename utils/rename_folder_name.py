@@ -1,9 +1,13 @@
 import os
+import argparse
 
 def rename_folders(path):
     for foldername in os.listdir(path):
         newname = foldername.replace(" ", "_")
         os.rename(os.path.join(path, foldername), os.path.join(path, newname))
 
-# Example usage:
-rename_folders("/data/yucheng/AI_System/BinSight/utils/")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Replace spaces in folder names with underscores')
+    parser.add_argument('path', help='directory whose entries are renamed')
+    rename_folders(parser.parse_args().path)
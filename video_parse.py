@@ -1,8 +1,13 @@
+import argparse
 import cv2
 import numpy as np
 from ultralytics import YOLO
 import time
 
+from motion_gate import MotionGate
+from tracker import StabilityTracker
+from video_pipeline import CropWriter, FramePipeline, open_source
+
 OBJECT_NAMES = {
     0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 4: 'airplane', 5: 'bus', 
     6: 'train', 7: 'truck', 8: 'boat', 9: 'traffic light', 10: 'fire hydrant', 
@@ -35,114 +40,144 @@ NOT_TRASH_CLASS_IDS = {
 
 NOT_TRASH_CLASS_IDS_FLAT = [item for sublist in NOT_TRASH_CLASS_IDS.values() for item in sublist]
 TRASH_CLASS_IDS = [id for id, _ in OBJECT_NAMES.items() if id not in NOT_TRASH_CLASS_IDS_FLAT]
-print(TRASH_CLASS_IDS)
-
-def detect_trash():
-    model = YOLO('yolov8n.pt')
-    cap = cv2.VideoCapture(1)
-
-    # Attempt to grab a frame to get video properties
-    ret, frame = cap.read()
-    if not ret:
-        print("Failed to capture video.")
-        cap.release()
-        return None, None, None
-    height, width = frame.shape[:2]
 
-    # Calculate ROI dimensions for 1/4 of the frame area
+def roi_bounds(height, width):
+    """Centered ROI covering 1/4 of the frame area, as (x1, y1, x2, y2)."""
     roi_area = (width * height) / 4
     roi_width = int(np.sqrt(roi_area * (width / height)))
     roi_height = int(roi_width * (height / width))
-
-    # Calculate the top-left corner of the ROI
-    roi_x1 = (width - roi_width) // 2
-    roi_y1 = (height - roi_height) // 2
-    roi_x2 = roi_x1 + roi_width
-    roi_y2 = roi_y1 + roi_height
-
-    roi_factor = 1/4
-
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    total_frames_to_capture = fps * 5
-    frames_captured = 0
-
-    stability_counts = {}
-    previous_bboxes = {}
-
-    saved_frame_path = None
-
-    # Dynamic stability threshold based on the size of the ROI
-    distance_threshold = np.sqrt(roi_area) * 0.1
-
-    while frames_captured < total_frames_to_capture:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    x1 = (width - roi_width) // 2
+    y1 = (height - roi_height) // 2
+    return x1, y1, x1 + roi_width, y1 + roi_height
+
+
+def trash_detections(result, bounds, roi_factor=1/4):
+    """Confident trash boxes from one YOLO result on an ROI crop, translated
+    to full-frame coordinates, keeping those covering at least `roi_factor`
+    of the ROI. Returns (boxes, classes)."""
+    roi_x1, roi_y1, roi_x2, roi_y2 = bounds
+    boxes = result.boxes.xyxy.cpu().numpy()
+    confs = result.boxes.conf.cpu().numpy()
+    clss = result.boxes.cls.cpu().numpy().astype(int)
+
+    # Translate box coordinates to full frame
+    boxes = boxes.astype(int) + [roi_x1, roi_y1, roi_x1, roi_y1]
+    bbox_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    roi_area = (roi_x2 - roi_x1) * (roi_y2 - roi_y1)
+    # Keep confident trash objects taking up at least a quarter of the ROI
+    keep = np.isin(clss, TRASH_CLASS_IDS) & (confs > 0.5) & \
+        (bbox_areas >= roi_area * roi_factor)
+    return boxes[keep], clss[keep]
+
+
+def detect_trash(source=1, display=True, duration=5.0, realtime=None,
+                 gate=None, writer=None):
+    model = YOLO('yolov8n.pt')
+    # crops are encoded and written off the frame loop
+    own_writer = writer is None
+    writer = writer or CropWriter('./test_images')
+    frame_source = open_source(source, realtime=realtime)
+    # skip the detector on frames where nothing in the ROI changed, and
+    # reuse the previous detections for them
+    gate = gate or MotionGate()
+
+    roi = {}
+
+    def setup_roi(frame):
+        roi['x1'], roi['y1'], roi['x2'], roi['y2'] = roi_bounds(*frame.shape[:2])
+        # Dynamic stability threshold based on the size of the ROI
+        roi_area = (roi['x2'] - roi['x1']) * (roi['y2'] - roi['y1'])
+        roi['tracker'] = StabilityTracker(stable_distance=np.sqrt(roi_area) * 0.1)
+
+    def detect(roi_frame):
+        results = model(roi_frame, verbose=False)
+        if not results or len(results) == 0:
+            return np.empty((0, 4), int), np.empty(0, int)
+        return trash_detections(
+            results[0], (roi['x1'], roi['y1'], roi['x2'], roi['y2']))
+
+    def process(captured):
+        frame = captured.image
+        if not roi:
+            setup_roi(frame)
+        roi_x1, roi_y1, roi_x2, roi_y2 = roi['x1'], roi['y1'], roi['x2'], roi['y2']
+
+        # Process only the ROI (before drawing on the frame)
+        roi_frame = frame[roi_y1:roi_y2, roi_x1:roi_x2].copy()
 
         # Highlight the ROI on the frame
         cv2.rectangle(frame, (roi_x1, roi_y1), (roi_x2, roi_y2), (255, 0, 0), 2)
 
-        # Process only the ROI
-        roi_frame = frame[roi_y1:roi_y2, roi_x1:roi_x2]
-        results = model(roi_frame)
-
-        if results and len(results) > 0:
-            boxes = results[0].boxes.xyxy.cpu()
-            confs = results[0].boxes.conf.cpu()
-            clss = results[0].boxes.cls.cpu()
-
-            for box, conf, cls in zip(boxes, confs, clss):
-                cls_idx = int(cls)
-                if cls_idx in TRASH_CLASS_IDS and conf > 0.5:
-                    # Translate box coordinates to full frame
-                    x1, y1, x2, y2 = map(int, box)
-                    x1 += roi_x1
-                    y1 += roi_y1
-                    x2 += roi_x1
-                    y2 += roi_y1
-
-                    bbox_area = (x2 - x1) * (y2 - y1)
-                    roi_area = (roi_x2 - roi_x1) * (roi_y2 - roi_y1)
-                    if bbox_area < roi_area * roi_factor:  # Check if bbox takes up quarter of the ROI
-                        continue  # Skip this object as it doesn't meet the size requirement
-
-                    current_bbox = [x1, y1, x2, y2]
-                    if cls_idx in previous_bboxes:
-                        dist = np.linalg.norm(np.array(previous_bboxes[cls_idx]) - np.array(current_bbox))
-                        if dist < distance_threshold:
-                            stability_counts[cls_idx] = stability_counts.get(cls_idx, 0) + 1
-                    else:
-                        stability_counts[cls_idx] = 0
-
-                    previous_bboxes[cls_idx] = current_bbox
-
-                    if stability_counts.get(cls_idx, 0) > 5:
-                        object_name = OBJECT_NAMES[cls_idx]
-                        # Save the ROI part of the frame where the object was detected
-                        cropped_frame = frame[y1:y2, x1:x2]
-                        saved_frame_path = f"./test_images/stable_frame_{object_name}.jpg"
-                        cv2.imwrite(saved_frame_path, cropped_frame)
-                        cap.release()
-                        cv2.destroyAllWindows()
-                        return saved_frame_path, cropped_frame, object_name
-
-        # Show the frame with the ROI highlighted
-        cv2.imshow("Frame", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-        frames_captured += 1
-
-    cap.release()
-    cv2.destroyAllWindows()
-    return saved_frame_path, None, None
+        if gate.should_run(roi_frame):
+            roi['last_detections'] = detect(roi_frame)
+        boxes, clss = roi['last_detections']
+
+        _, stable_counts = roi['tracker'].update(boxes, clss)
+        for (x1, y1, x2, y2), cls_idx, count in zip(boxes, clss, stable_counts):
+            if count > 5:
+                object_name = OBJECT_NAMES[cls_idx]
+                # Save the ROI part of the frame where the object was detected
+                cropped_frame = roi_frame[y1 - roi_y1:y2 - roi_y1, x1 - roi_x1:x2 - roi_x1]
+                saved_frame_path = writer.save(cropped_frame,
+                                               f"stable_frame_{object_name}")
+                return frame, (saved_frame_path, cropped_frame, object_name)
+
+        return frame, None
+
+    pipeline = FramePipeline(frame_source, process, display=display,
+                             duration=duration)
+    result = pipeline.run()
+    # report the crop that was just queued as written
+    if own_writer:
+        writer.close()
+    else:
+        writer.flush()
+    print({**pipeline.stats(), **writer.stats(),
+           'detector_skipped_fraction': round(gate.skipped_fraction, 3)})
+    return result or (None, None, None)
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Detect a stable trash object in a camera, video or image folder')
+    parser.add_argument('--source', default='1', type=str,
+                        help='camera index, video file or image directory '
+                             '(default: 1)')
+    parser.add_argument('--duration', default=5.0, type=float,
+                        help='give up after this many seconds (default: 5)')
+    parser.add_argument('--headless', action='store_true',
+                        help='do not open any windows')
+    parser.add_argument('--no-realtime', action='store_true',
+                        help='read files as fast as possible instead of at '
+                             'their frame rate')
+    parser.add_argument('--motion-threshold', default=4.0, type=float,
+                        help='mean gray-level change in the ROI needed to '
+                             're-run the detector, 0 runs it on every frame '
+                             '(default: 4)')
+    parser.add_argument('--refresh-every', default=15, type=int,
+                        help='run the detector at least every N frames '
+                             '(default: 15)')
+    parser.add_argument('--crop-dir', default='./test_images', type=str,
+                        help='where the stable crop is written (default: '
+                             './test_images)')
+    parser.add_argument('--memory-only', action='store_true',
+                        help='keep the crop in memory instead of writing it')
+    return parser
 
 if __name__ == '__main__':
-    saved_frame_path, cropped_frame, object_name = detect_trash()
+    args = get_args_parser().parse_args()
+    writer = CropWriter(None if args.memory_only else args.crop_dir)
+    saved_frame_path, cropped_frame, object_name = detect_trash(
+        args.source, display=not args.headless, duration=args.duration,
+        realtime=False if args.no_realtime else None,
+        gate=MotionGate(args.motion_threshold, args.refresh_every),
+        writer=writer)
+    writer.close()
     if saved_frame_path:
-        print("Saved frame path:", saved_frame_path)
-        cv2.imshow("Cropped frame", cropped_frame)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        print("Kept in memory:" if args.memory_only else "Saved frame path:",
+              saved_frame_path)
+        if not args.headless:
+            cv2.imshow("Cropped frame", cropped_frame)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
     else:
         print("No stable trash object detected.")
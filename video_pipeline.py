@@ -0,0 +1,346 @@
+import collections
+import glob
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class VideoSource:
+    """cv2.VideoCapture over a device index or a video file.
+
+    Files are paced to their native FPS when `realtime` is set, so they
+    behave like a camera; otherwise frames are read as fast as possible.
+    """
+
+    def __init__(self, spec, realtime=None):
+        self.capture = cv2.VideoCapture(spec)
+        self.is_device = isinstance(spec, int)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = (not self.is_device) if realtime is None else realtime
+
+    def read(self):
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirSource:
+    """Serves the images of a directory, in name order, as a video."""
+
+    def __init__(self, path, fps=30.0, realtime=True, loop=False):
+        self.paths = sorted(p for p in glob.glob(os.path.join(path, '*'))
+                            if p.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self._next = 0
+
+    def read(self):
+        if self._next >= len(self.paths):
+            if not self.loop or not self.paths:
+                return None
+            self._next = 0
+        frame = cv2.imread(self.paths[self._next])
+        self._next += 1
+        return frame
+
+    def release(self):
+        pass
+
+
+def open_source(spec, fps=30.0, realtime=None):
+    """Open a device index ("1"), a video file or a directory of images."""
+    if isinstance(spec, int) or str(spec).isdigit():
+        return VideoSource(int(spec), realtime)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps, True if realtime is None else realtime)
+    return VideoSource(spec, realtime)
+
+
+class LatestSlot:
+    """Single-item queue where a new item replaces an unconsumed one."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next item, or None once the slot is closed and drained."""
+        with self._cond:
+            while self._item is None and not self._closed:
+                if not self._cond.wait(timeout):
+                    return None
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Frame:
+    __slots__ = ('index', 'image', 'captured_at')
+
+    def __init__(self, index, image, captured_at):
+        self.index = index
+        self.image = image
+        self.captured_at = captured_at
+
+
+class Capture(threading.Thread):
+    """Reads `source` into `slot` until it ends or `stop_event` is set.
+
+    Paced to the source's FPS when it is `realtime`; closes the slot on exit.
+    """
+
+    def __init__(self, source, slot, stop_event):
+        super().__init__(daemon=True)
+        self.source = source
+        self.slot = slot
+        self.stop_event = stop_event
+        self.captured = 0
+
+    def run(self):
+        interval = 1.0 / self.source.fps if self.source.realtime else 0.0
+        next_at = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                image = self.source.read()
+                if image is None:
+                    break
+                self.slot.put(Frame(self.captured, image, time.perf_counter()))
+                self.captured += 1
+                if interval:
+                    next_at += interval
+                    time.sleep(max(0.0, next_at - time.perf_counter()))
+        finally:
+            self.slot.close()
+
+
+class CropWriter(threading.Thread):
+    """Encodes and writes crops on a background thread.
+
+    `save` never blocks the frame loop: it names the crop (`<name>_<ms>_<n>`
+    plus `ext`, unique across runs) and queues it. A crop whose `key` is
+    still queued replaces the older one (coalesced); when `max_pending`
+    crops are queued the oldest is dropped. With `directory=None` nothing
+    touches the disk and the last `keep` encoded crops stay in `crops` as
+    (filename, bytes). The writer keeps a reference to the image, so pass a
+    copy if the caller will draw on it. `flush` waits for everything queued
+    so far; `close` also writes what is still queued.
+    """
+
+    def __init__(self, directory, max_pending=8, ext='.jpg', keep=32):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.max_pending = max_pending
+        self.ext = ext
+        self.crops = collections.deque(maxlen=keep)
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._closed = False
+        self._busy = False
+        self._count = 0
+        self.written = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.start()
+
+    def save(self, image, name, key=None):
+        """Queue `image`; returns the path (or, in memory, the filename)."""
+        with self._cond:
+            self._count += 1
+            filename = f'{name}_{int(time.time() * 1000)}_{self._count}{self.ext}'
+            path = filename if self.directory is None \
+                else os.path.join(self.directory, filename)
+            key = path if key is None else key
+            if key in self._pending:
+                del self._pending[key]
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = (path, image)
+            self._cond.notify_all()
+        return path
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, (path, image) = self._pending.popitem(last=False)
+                self._busy = True
+            try:
+                self._write(path, image)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, path, image):
+        ok, data = cv2.imencode(self.ext, image)
+        if not ok:
+            self.failed += 1
+            return
+        if self.directory is None:
+            self.crops.append((path, data.tobytes()))
+        else:
+            try:
+                with open(path, 'wb') as f:
+                    f.write(data.tobytes())
+            except OSError:
+                self.failed += 1
+                return
+        self.written += 1
+
+    def flush(self, timeout=None):
+        """Wait until every crop queued so far is written (or dropped)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not (self._pending or self._busy) or not self.is_alive(),
+                timeout)
+
+    def close(self, timeout=None):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join(timeout)
+
+    def stats(self):
+        return {'crops_written': self.written,
+                'crops_dropped': self.dropped,
+                'crops_coalesced': self.coalesced,
+                'crops_failed': self.failed}
+
+
+class FramePipeline:
+    """Capture -> process -> display, each stage on its own thread.
+
+    Stages are linked by `LatestSlot`s, so a slow stage always works on the
+    newest frame and stale frames are dropped instead of queueing up.
+    `process(frame)` returns `(image_to_show, result)`. By default a result
+    other than None stops the pipeline and is returned by `run`; with
+    `stop_on_result=False` the pipeline keeps going and hands each result to
+    `on_result(frame, result)` instead. Display and `on_result` run on the
+    calling thread (OpenCV GUI calls must stay on the main thread). An
+    exception raised by `process` stops the pipeline and is re-raised by
+    `run`.
+    """
+
+    def __init__(self, source, process, display=True, window='Frame',
+                 duration=None, stop_on_result=True, on_result=None):
+        self.source = source
+        self.process = process
+        self.display = display
+        self.window = window
+        self.duration = duration
+        self.stop_on_result = stop_on_result
+        self.on_result = on_result
+        self.frames = LatestSlot()
+        self.outputs = LatestSlot()
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        self.capture = Capture(source, self.frames, self.stop_event)
+        self.result = None
+        self.error = None
+        self.processed = 0
+        self.latencies = []
+
+    @property
+    def captured(self):
+        return self.capture.captured
+
+    def _process(self):
+        try:
+            while not self.stop_event.is_set():
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                try:
+                    image, result = self.process(frame)
+                except Exception as e:
+                    self.error = e
+                    self.stop_event.set()
+                    break
+                self.processed += 1
+                if result is not None and self.stop_on_result:
+                    self.result = result
+                    self.stop_event.set()
+                elif result is not None:
+                    # unlike frames, results are never dropped
+                    self.results.put((frame, result))
+                self.outputs.put((frame, image))
+        finally:
+            self.outputs.close()
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        threads = [self.capture,
+                   threading.Thread(target=self._process, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                if self.duration and \
+                        time.perf_counter() - self.started_at > self.duration:
+                    break
+                while not self.results.empty():
+                    self.on_result(*self.results.get())
+                output = self.outputs.get(timeout=0.1)
+                if output is None:
+                    if not threads[1].is_alive():
+                        break
+                    continue
+                frame, image = output
+                if self.display and image is not None:
+                    cv2.imshow(self.window, image)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                self.latencies.append(time.perf_counter() - frame.captured_at)
+            while not self.results.empty():
+                self.on_result(*self.results.get())
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            self.source.release()
+            self.elapsed = time.perf_counter() - self.started_at
+            if self.display:
+                cv2.destroyAllWindows()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def stats(self):
+        latencies = np.array(self.latencies or [0.0]) * 1000
+        return {'capture_fps': round(self.captured / self.elapsed, 2),
+                'detect_fps': round(self.processed / self.elapsed, 2),
+                'frames_captured': self.captured,
+                'frames_processed': self.processed,
+                'frames_dropped': self.frames.dropped,
+                'latency_ms_p50': round(float(np.percentile(latencies, 50)), 2),
+                'latency_ms_p95': round(float(np.percentile(latencies, 95)), 2)}
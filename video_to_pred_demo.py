@@ -1,16 +1,18 @@
+import argparse
+import json
+import os
+import sys
+import time
 import cv2
 import numpy as np
 from ultralytics import YOLO
-import time
-import os
-from PIL import Image, ImageTk
-import torch
-from torch.autograd import Variable
-import torchvision.transforms as transforms
-from efficientnet_pytorch import EfficientNet
-from PyQt5.QtWidgets import QApplication, QLabel, QVBoxLayout, QPushButton, QWidget
-from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import Qt
+
+from track_labels import TrackLabels, add_track_label_args, track_labels_factory
+from tracker import StabilityTracker
+from video_pipeline import CropWriter, FramePipeline, open_source
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier'))
+from inference import load_classifier
 
 
 # Constants
@@ -56,138 +58,174 @@ Considering these as "trash" when calculating stability (mainly as an approximat
 
 TRASH_CLASS_IDS = [39, 40, 41, 42, 43, 44, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 73, 75, 79]
 
-def detect_trash():
-    model = YOLO('yolov8n.pt')
-    cap = cv2.VideoCapture(1)
-    
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    total_frames_to_capture = fps * 5
-    frames_captured = 0
-
-    stability_counts = {}
-    previous_bboxes = {}
-
-    saved_frame_path = None
-    while frames_captured < total_frames_to_capture:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # run inference on frame
-        results = model(frame)
-
-        # extract bboxes, confs, and classes
-        if results and len(results) > 0:
-            boxes = results[0].boxes.xyxy.cpu()
-            confs = results[0].boxes.conf.cpu()
-            clss = results[0].boxes.cls.cpu()
-
-            for box, conf, cls in zip(boxes, confs, clss):
-                cls_idx = int(cls)
-                print("Predicted class:", cls_idx, " with confidence:", conf)
-                if cls_idx in TRASH_CLASS_IDS and conf > 0.5:
-                    print("Predicted trash class:", cls, " with confidence:", conf)
-                    x1, y1, x2, y2 = map(int, box)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    
-                    current_bbox = [x1, y1, x2, y2]
-                    if cls_idx in previous_bboxes:
-                        dist = np.linalg.norm(np.array(previous_bboxes[cls_idx]) - np.array(current_bbox))
-                        if dist < 50: 
-                            stability_counts[cls_idx] = stability_counts.get(cls_idx, 0) + 1
-                    else:
-                        stability_counts[cls_idx] = 0
-                    
-                    previous_bboxes[cls_idx] = current_bbox
-
-                    if stability_counts.get(cls_idx, 0) > 5:
-                        object_name = OBJECT_NAMES[cls_idx]
-                        cropped_frame = frame[y1:y2, x1:x2]  # Crop the image to the bounding box
-                        saved_frame_path = f"./test_images/stable_frame_{object_name}.jpg"
-                        cv2.imwrite(saved_frame_path, cropped_frame)
-                        cap.release()
-                        cv2.destroyAllWindows()
-                        return saved_frame_path, cropped_frame, object_name  # Return path of saved frame
-        
-        cv2.imshow("Frame", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-        frames_captured += 1
-
-    cap.release()
-    cv2.destroyAllWindows()
-    return saved_frame_path, None, None
-
-def load_model(model_name, num_classes, checkpoint_path):
-    model = EfficientNet.from_pretrained(model_name, num_classes=num_classes)
-    checkpoint = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-    new_checkpoint = {}
-    for k, v in checkpoint['state_dict'].items():
-        new_checkpoint[k.replace('efficient_net.', '')] = v
-    model.load_state_dict(new_checkpoint)
-    model.eval()
-    return model
-
-def predict_image(image, model, device):
-    test_transforms = transforms.Compose([transforms.Resize((260, 260)), transforms.ToTensor()])
-    image_tensor = test_transforms(image).float().to(device)
-    image_tensor = image_tensor.unsqueeze_(0)
-    input_img = Variable(image_tensor)
-    input_img = input_img.to(device)
-    model.to(device)
-    output = model(input_img)
-    prob = torch.nn.functional.softmax(output, dim=1)
-    index = output.data.cpu().numpy().argmax()
-    confidence = prob[0][index].item()
-    return index, confidence
-
-def display_result(cropped_frame, predicted_class, object_name, confidence):
-    app = QApplication([])
-    
-    # Convert the OpenCV image format (BGR) to QImage (RGB)
-    cropped_frame_rgb = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2RGB)
-    height, width, channel = cropped_frame_rgb.shape
-    bytesPerLine = 3 * width
-    q_img = QImage(cropped_frame_rgb.data, width, height, bytesPerLine, QImage.Format_RGB888)
-    pixmap = QPixmap.fromImage(q_img)
-
-    # Create the main window
-    window = QWidget()
-    window.setWindowTitle("Prediction Result")
-    layout = QVBoxLayout()
-
-    # Add the image
-    img_label = QLabel()
-    img_label.setPixmap(pixmap)
-    layout.addWidget(img_label)
-
-    # Adding result below the image
-    result_label = QLabel(f"Predicted Trash Class: {predicted_class}\nPredicted Object: {object_name}")
-    layout.addWidget(result_label)
-
-    # Quit button
-    quit_button = QPushButton("Quit")
-    quit_button.clicked.connect(app.exit)
-    layout.addWidget(quit_button)
-
-    window.setLayout(layout)
-    window.show()
-    
-    app.exec_()
-
-def predict_and_display(model, cropped_frame, object_name, device="cpu"):
-    image = Image.fromarray(cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2RGB))
-    index, confidence = predict_image(image, model, device)
-    classes = ['Bio', 'Glass', 'Metals and Plastics', 'Non-recyclable', 'Paper']
-    predicted_class = classes[index]
-    # Convert the cropped frame to a temporary file path for display
-    temp_path = "./test_images/temp_cropped_frame.jpg"
-    cv2.imwrite(temp_path, cropped_frame)
-    display_result(cropped_frame, predicted_class, object_name, confidence)
+CLASSES = ['Bio', 'Glass', 'Metals and Plastics', 'Non-recyclable', 'Paper']
+
+
+class DetectClassifyEngine:
+    """Keeps YOLO and EfficientNet resident and runs detect -> classify.
+
+    Every frame goes through YOLO and the stability tracker. Labels belong to
+    tracks (`TrackLabels`): a stable object is classified when it first
+    becomes stable and afterwards only while its label is uncertain or its
+    crop changes, with all crops of a frame in one batched forward pass.
+    `process` returns the annotated frame and the events for tracks whose
+    label was set or changed in that frame; the
+    `detect_batch` / `track` / `label` steps can also be driven separately
+    to batch across frames (see process_videos.py). With a `CropWriter`, the
+    crop behind each event is saved in the background and its path added to
+    the event as `crop`.
+    """
+
+    def __init__(self, classifier, stable_frames=5, detector='yolov8n.pt',
+                 classes=CLASSES, labels=None, writer=None):
+        # a weights path, or an already loaded model called like YOLO
+        self.detector = YOLO(detector) if isinstance(detector, str) \
+            else detector
+        self.classifier = classifier
+        self.stable_frames = stable_frames
+        self.classes = classes
+        self.labels_factory = labels or TrackLabels
+        self.writer = writer
+        self.reset()
+
+    def reset(self):
+        """Forget all tracks, e.g. before starting another video."""
+        self.tracker = StabilityTracker(stable_distance=50)
+        self.labels = self.labels_factory()
+
+    def detect_batch(self, frames):
+        """One YOLO call over several frames; (boxes, classes) per frame."""
+        detections = []
+        for result in self.detector(list(frames), verbose=False):
+            boxes = result.boxes.xyxy.cpu().numpy().astype(int)
+            confs = result.boxes.conf.cpu().numpy()
+            clss = result.boxes.cls.cpu().numpy().astype(int)
+            keep = np.isin(clss, TRASH_CLASS_IDS) & (confs > 0.5)
+            detections.append((boxes[keep], clss[keep]))
+        return detections
+
+    def classify(self, crops):
+        labels, scores = self.classifier.predict(
+            [cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) for crop in crops])
+        return list(zip(labels, scores))
+
+    def track(self, frame_index, frame, boxes, clss):
+        """Update the tracker; returns (track_ids, pending) where pending
+        holds (crop, event) for each stable object that needs classifying."""
+        track_ids, stable_counts = self.tracker.update(boxes, clss)
+        pending = []
+        for i in np.flatnonzero(stable_counts > self.stable_frames):
+            x1, y1, x2, y2 = boxes[i]
+            crop = frame[y1:y2, x1:x2]
+            if crop.size == 0 or not self.labels.needs(int(track_ids[i]), crop):
+                continue
+            pending.append((crop.copy(),
+                            {'event': 'classified',
+                             'frame': frame_index,
+                             'time': time.time(),
+                             'track_id': int(track_ids[i]),
+                             'object': OBJECT_NAMES[clss[i]],
+                             'box': boxes[i].tolist()}))
+        self.labels.expire(self.tracker.ids.tolist())
+        return track_ids, pending
+
+    def label(self, pending):
+        """Classify pending crops (from any number of frames) in one batch;
+        returns events for the tracks whose label was set or changed."""
+        if not pending:
+            return []
+        crops, events = zip(*pending)
+        changed = []
+        for crop, event, (index, confidence) in zip(crops, events,
+                                                     self.classify(crops)):
+            label, confidence, is_new = self.labels.add(
+                event['track_id'], self.classes[index], confidence, crop)
+            if is_new:
+                event['label'] = label
+                event['confidence'] = round(confidence, 4)
+                if self.writer is not None:
+                    event['crop'] = self.writer.save(
+                        crop, f"track{event['track_id']}_{label}",
+                        key=event['track_id'])
+                changed.append(event)
+        return changed
+
+    def annotate(self, frame, boxes, track_ids):
+        for (x1, y1, x2, y2), track_id in zip(boxes, track_ids):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            labelled = self.labels.get(int(track_id))
+            if labelled is not None:
+                label, confidence = labelled
+                cv2.putText(frame, f'{label} {confidence:.2f}', (x1, max(y1 - 8, 12)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        return frame
+
+    def process(self, captured):
+        frame = captured.image
+        (boxes, clss), = self.detect_batch([frame])
+        track_ids, pending = self.track(captured.index, frame, boxes, clss)
+        events = self.label(pending)
+        return self.annotate(frame, boxes, track_ids), events or None
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser(
+        'Detect trash objects and classify them continuously')
+    parser.add_argument('--source', default='1', type=str,
+                        help='camera index, video file or image directory '
+                             '(default: 1)')
+    parser.add_argument('--headless', action='store_true',
+                        help='no windows; write events as JSON lines')
+    parser.add_argument('--events', default='-', type=str,
+                        help='file to append JSON events to (default: stdout)')
+    parser.add_argument('--save-crops', default=None, type=str, metavar='DIR',
+                        help='write the crop behind each event here, off the '
+                             'frame loop')
+    parser.add_argument('--duration', default=None, type=float,
+                        help='stop after this many seconds (default: run '
+                             'until the source ends or q is pressed)')
+    parser.add_argument('--stable-frames', default=5, type=int,
+                        help='frames an object must hold still before it is '
+                             'classified (default: 5)')
+    parser.add_argument(
+        '--model_name', default='efficientnet-b2', type=str,
+        help='Name of model to use (default: "efficientnet-b2")')
+    parser.add_argument(
+        '--num-classes', type=int, default=5, metavar='NUM',
+        help='number of classes to classify (default: 5)')
+    parser.add_argument(
+        '--checkpoint',
+        help='path to directory to the saved checkpoint',
+        default='./classifier/lightning_logs/version_0/checkpoints/effnet.ckpt')
+    parser.add_argument('--device', help='specify device to use',
+                        default="cpu", type=str)
+    add_track_label_args(parser)
+    return parser
+
 
 if __name__ == '__main__':
-    model = load_model(model_name='efficientnet-b2', num_classes=5, checkpoint_path='./classifier/lightning_logs/version_0/checkpoints/effnet.ckpt')
-    detected_frame_path, detected_cropped_frame, object_name = detect_trash()
-    if detected_frame_path:
-        predict_and_display(model, detected_cropped_frame, object_name, device="cpu")
+    args = get_args_parser().parse_args()
+    classifier = load_classifier(args.model_name, args.num_classes,
+                                 args.checkpoint, args.device)
+    writer = CropWriter(args.save_crops) if args.save_crops else None
+    engine = DetectClassifyEngine(classifier, stable_frames=args.stable_frames,
+                                  labels=track_labels_factory(args),
+                                  writer=writer)
+
+    out = sys.stdout if args.events == '-' else open(args.events, 'a')
+
+    def emit(frame, events):
+        for event in events:
+            out.write(json.dumps(event) + '\n')
+        out.flush()
+
+    pipeline = FramePipeline(open_source(args.source), engine.process,
+                             display=not args.headless,
+                             duration=args.duration,
+                             stop_on_result=False, on_result=emit)
+    pipeline.run()
+    if writer is not None:
+        writer.close()
+    print(json.dumps({'event': 'stats', **pipeline.stats(),
+                      **engine.labels.stats(),
+                      **(writer.stats() if writer else {})}), file=sys.stderr)